@@ -0,0 +1,220 @@
+"""Offline batch analysis of a list of locations.
+
+Reads a CSV of sites and runs the analysis pipeline functions from main.py
+directly (emission-source lookup, pollutant classification, air quality and
+weather) on a thread pool. The per-upstream concurrency caps from main.py
+apply, so raising --workers does not raise the load on any single upstream
+past its cap.
+
+Each result is appended to an NDJSON file as soon as it is ready. Completed
+rows are also recorded in a checkpoint file; re-running the same command
+skips them, so an interrupted run resumes where it stopped. Failed rows,
+including rows where reverse geocoding, Overpass or OpenWeather failed, are
+written with "status": "error" but not checkpointed, so they are retried on
+the next run.
+
+CSV columns: either latitude,longitude (or lat,lon) or area,city. An optional
+id column names the row; otherwise the 1-based row number is used.
+
+Usage:
+    python batch_analyze.py sites.csv -o results.ndjson --workers 8
+"""
+import argparse
+import contextlib
+import csv
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import main as pipeline
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def read_sites(path):
+    """Yield (row key, row dict) for each CSV row."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for number, row in enumerate(csv.DictReader(f), start=1):
+            row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+            yield row.get("id") or str(number), row
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def analyze_site(row, radius, max_elements, include_geojson):
+    """Run the pipeline for one CSV row and return the result record."""
+    lat = row.get("latitude") or row.get("lat")
+    lon = row.get("longitude") or row.get("lon")
+    if lat and lon:
+        lat, lon = float(lat), float(lon)
+        # Coordinates are already known, so skip the forward geocode
+        location = pipeline.reverse_geocode(lat, lon)
+        if 'error' in location:
+            # Do not checkpoint placeholder area and city names
+            raise RuntimeError(location['error'])
+        area_name, city_name = location['area'], location['city']
+        pois_table, search = pipeline.fetch_emission_sources(lat, lon, radius, max_elements)
+        geocode = {"lat": lat, "lon": lon, "display_name": location['display_name']}
+        bbox = None
+    elif row.get("area") or row.get("city"):
+        area_name, city_name = row.get("area", ""), row.get("city", "")
+        overpass_pois_data = pipeline.get_pois_overpass(area_name, city_name, [], radius, max_elements)
+        if "error" in overpass_pois_data:
+            raise ValueError(overpass_pois_data["error"])
+        pois_table = overpass_pois_data['pois']
+        search = overpass_pois_data['search']
+        geocode = overpass_pois_data['geocode']
+        bbox = overpass_pois_data['bbox']
+    else:
+        raise ValueError("Row needs latitude/longitude or area/city")
+    # Upstream failures come back as flags or error dicts rather than
+    # exceptions; raise so the row is not checkpointed and is retried
+    if search.get('error'):
+        raise RuntimeError(search['error'])
+
+    pois_geojson, _, pie_chart_data = pipeline.generate_pois_geojson(area_name, city_name, pois_table, bbox)
+    air_quality = pipeline.get_air_quality(geocode['lat'], geocode['lon'])
+    if 'error' in air_quality:
+        raise RuntimeError(air_quality['error'])
+    weather = pipeline.get_weather_data(geocode['lat'], geocode['lon'])
+    if 'error' in weather:
+        raise RuntimeError(weather['error'])
+
+    record = {
+        "area": area_name,
+        "city": city_name,
+        "geocode": geocode,
+        "bbox": bbox,
+        "search": search,
+        "source_count": len(pois_table),
+        "pie_chart_data": pie_chart_data,
+        "air_quality": air_quality,
+        "weather": weather,
+    }
+    if include_geojson:
+        record["geojson"] = pois_geojson
+    return record
+
+
+def run(args):
+    for name, limit in (("nominatim", args.nominatim_concurrency),
+                        ("overpass", args.overpass_concurrency),
+                        ("openweather", args.openweather_concurrency)):
+        if limit:
+            pipeline.set_upstream_limit(name, limit)
+    if args.gemini_concurrency:
+        pipeline.set_llm_concurrency(args.gemini_concurrency)
+
+    output_path = args.output or os.path.splitext(args.input)[0] + ".ndjson"
+    checkpoint_path = args.checkpoint or output_path + ".checkpoint"
+    done = load_checkpoint(checkpoint_path)
+    radius = pipeline.parse_search_radius(args.radius)
+
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    start = time.perf_counter()
+    max_in_flight = args.workers * 2
+
+    with open(output_path, "a", encoding="utf-8") as output, \
+            open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="site") as executor:
+
+        def write(key, row, started, future):
+            try:
+                record = {"row": key, "status": "ok", **future.result()}
+                counts["ok"] += 1
+            except Exception as e:
+                record = {"row": key, "status": "error", "error": str(e), "input": row}
+                counts["error"] += 1
+            record["seconds"] = round(time.perf_counter() - started, 3)
+            output.write(pipeline.dumps_results(record) + "\n")
+            output.flush()
+            # Checkpoint only after the result is safely in the output file
+            if record["status"] == "ok":
+                checkpoint.write(key + "\n")
+                checkpoint.flush()
+            finished = counts["ok"] + counts["error"]
+            if finished % args.progress_every == 0:
+                elapsed = time.perf_counter() - start
+                log(f"{finished} rows done ({counts['error']} failed), {finished / elapsed:.2f} rows/s")
+
+        pending = {}
+        try:
+            for key, row in read_sites(args.input):
+                if key in done:
+                    counts["skipped"] += 1
+                    continue
+                # Keep a bounded window of submitted rows so huge files stream through
+                while len(pending) >= max_in_flight:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        write(*pending.pop(future), future)
+                future = executor.submit(analyze_site, row, radius, args.max_elements, args.include_geojson)
+                pending[future] = (key, row, time.perf_counter())
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write(*pending.pop(future), future)
+        except KeyboardInterrupt:
+            log("Interrupted; finishing rows in progress. Re-run the same command to resume.")
+            for future in pending:
+                future.cancel()
+            for future, (key, row, started) in pending.items():
+                if not future.cancelled():
+                    wait([future])
+                    write(key, row, started, future)
+
+    elapsed = time.perf_counter() - start
+    processed = counts["ok"] + counts["error"]
+    log("")
+    log("=== Batch summary ===")
+    log(f"Output:      {output_path}")
+    log(f"Processed:   {processed} rows ({counts['ok']} ok, {counts['error']} failed)")
+    log(f"Skipped:     {counts['skipped']} rows already checkpointed")
+    log(f"Elapsed:     {elapsed:.1f} s")
+    if processed:
+        log(f"Throughput:  {processed / elapsed:.2f} rows/s, {elapsed / processed:.2f} s/row")
+    cache = pipeline.shared_cache.local_stats()
+    if cache:
+        log("Cache hits:  " + ", ".join(
+            f"{name} {stats['hits']}/{stats['hits'] + stats['misses']}" for name, stats in sorted(cache.items())
+        ))
+    llm = pipeline.llm_scheduler.metrics()["classes"]
+    log("LLM calls:   " + ", ".join(
+        f"{name} {stats['calls']} (p50 {stats['latency_p50']} s)" for name, stats in llm.items() if stats["calls"]
+    ))
+    return 1 if counts["error"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV file of sites")
+    parser.add_argument("-o", "--output", help="NDJSON output (default: <input>.ndjson)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--workers", type=int, default=8, help="Sites processed concurrently")
+    parser.add_argument("--radius", default=None, help="Search radius in metres, or 'auto'")
+    parser.add_argument("--max-elements", type=int, default=pipeline.DEFAULT_MAX_ELEMENTS)
+    parser.add_argument("--include-geojson", action="store_true", help="Include the POI GeoJSON in each record")
+    parser.add_argument("--nominatim-concurrency", type=int, help="Concurrent Nominatim requests")
+    parser.add_argument("--overpass-concurrency", type=int, help="Concurrent Overpass requests")
+    parser.add_argument("--openweather-concurrency", type=int, help="Concurrent OpenWeather requests")
+    parser.add_argument("--gemini-concurrency", type=int, help="Concurrent Gemini calls")
+    parser.add_argument("--progress-every", type=int, default=25, help="Log progress every N rows")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Hide the pipeline's own log output")
+    args = parser.parse_args()
+
+    if args.quiet:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            sys.exit(run(args))
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
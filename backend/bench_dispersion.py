@@ -0,0 +1,64 @@
+"""Benchmark for the Gaussian-plume dispersion engine.
+
+Times concentration_field() for a synthetic set of point sources spread over
+the grid, with the default chunk size, on a single process.
+
+Usage:
+    python bench_dispersion.py [--sources 3000] [--grid 500] [--radius 5000] [--stability C]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from dispersion import EMISSION_WEIGHTS, concentration_field, encode_raster, grid_bounds, sources_from_categories
+
+CENTER_LAT, CENTER_LON = 19.045, 72.845
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sources", type=int, default=3000)
+    parser.add_argument("--grid", type=int, default=500)
+    parser.add_argument("--radius", type=float, default=5000)
+    parser.add_argument("--wind-speed", type=float, default=3.0)
+    parser.add_argument("--wind-direction", type=float, default=250)
+    parser.add_argument("--stability", default="C")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    west, south, east, north = grid_bounds(CENTER_LAT, CENTER_LON, args.radius)
+    lat = rng.uniform(south, north, args.sources)
+    lon = rng.uniform(west, east, args.sources)
+    super_categories = rng.choice(list(EMISSION_WEIGHTS), args.sources)
+    src_lat, src_lon, q, h = sources_from_categories(lat, lon, super_categories)
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        field = concentration_field(
+            src_lat, src_lon, q, h, CENTER_LAT, CENTER_LON, args.radius, args.grid,
+            args.wind_speed, args.wind_direction, args.stability
+        )
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    concentration_field(
+        src_lat, src_lon, q, h, CENTER_LAT, CENTER_LON, args.radius, args.grid,
+        args.wind_speed, args.wind_direction, args.stability
+    )
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    raster = encode_raster(field, (west, south, east, north))
+    pairs = args.sources * args.grid * args.grid
+    best = min(timings)
+    print(f"{args.sources} sources x {args.grid}x{args.grid} grid ({pairs / 1e6:.0f}M source-cell pairs)")
+    print(f"best {best:.2f} s, mean {sum(timings) / len(timings):.2f} s ({pairs / best / 1e6:.0f}M pairs/s)")
+    print(f"peak traced memory {peak / 1e6:.1f} MB, encoded raster {len(raster['data']) / 1e3:.0f} kB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Memory benchmark for Overpass response parsing.
+
+Compares peak Python heap usage (tracemalloc) of:
+  - eager:     read the whole body, json.loads() it, then classify elements
+  - streaming: decode elements chunk by chunk with overpass_stream and classify
+               them as they arrive
+
+Usage:
+    python bench_overpass_memory.py recorded_response.json
+    python bench_overpass_memory.py --synthetic 200000
+
+A recorded response can be saved with e.g.
+    curl -s --data-binary @query.overpassql https://overpass-api.de/api/interpreter > recorded_response.json
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from main import build_poi_table
+from overpass_stream import iter_elements
+
+CHUNK_SIZE = 64 * 1024
+
+SYNTHETIC_TAGS = [
+    {"man_made": "storage_tank", "content": "oil", "operator": "Example Refining Co."},
+    {"industrial": "refinery", "name": "Example Refinery", "addr:city": "Example City"},
+    {"amenity": "fuel", "brand": "Example Fuel", "opening_hours": "24/7"},
+    {"power": "substation", "voltage": "220000;66000", "substation": "transmission"},
+    {"landuse": "landfill", "name": "Example Landfill"},
+]
+
+
+def write_synthetic_response(path, count):
+    """Write an Overpass-shaped JSON document with ``count`` elements."""
+    rng = random.Random(42)
+    with open(path, "w") as f:
+        f.write('{"version": 0.6, "generator": "synthetic", "osm3s": {}, "elements": [\n')
+        for i in range(count):
+            tags = dict(rng.choice(SYNTHETIC_TAGS), ref=str(i))
+            if i % 3:
+                element = {"type": "node", "id": i, "lat": 19 + rng.random(), "lon": 72 + rng.random(), "tags": tags}
+            else:
+                element = {"type": "way", "id": i, "center": {"lat": 19 + rng.random(), "lon": 72 + rng.random()},
+                           "nodes": list(range(i, i + 20)), "tags": tags}
+            f.write(("," if i else "") + json.dumps(element) + "\n")
+        f.write("]}\n")
+
+
+def run_eager(path):
+    with open(path, "rb") as f:
+        body = f.read()
+    data = json.loads(body)
+    return build_poi_table(data.get("elements", []))
+
+
+def run_streaming(path):
+    with open(path, "rb") as f:
+        chunks = iter(lambda: f.read(CHUNK_SIZE), b"")
+        return build_poi_table(iter_elements(chunks))
+
+
+def measure(fn, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(result)
+    del result
+    return peak, elapsed, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("response", nargs="?", help="Recorded Overpass JSON response")
+    parser.add_argument("--synthetic", type=int, default=100000,
+                        help="Number of synthetic elements when no recorded response is given")
+    args = parser.parse_args()
+
+    path = args.response
+    tmp = None
+    if path is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+        tmp.close()
+        path = tmp.name
+        write_synthetic_response(path, args.synthetic)
+
+    try:
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"Response: {path} ({size_mb:.1f} MB)")
+        for name, fn in (("eager", run_eager), ("streaming", run_streaming)):
+            peak, elapsed, count = measure(fn, path)
+            print(f"{name:>10}: peak {peak / 1e6:8.1f} MB  ({peak / 1e6 / size_mb:.2f}x body)  "
+                  f"{elapsed:6.2f} s  {count} POIs")
+    finally:
+        if tmp is not None:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Startup benchmark for the API worker.
+
+Measures two things:
+  1. Import time of main.py in a fresh interpreter (median of several runs).
+  2. Time-to-first-request: from launching a uvicorn worker until /health answers.
+
+Usage:
+    python bench_startup.py [--runs 5] [--port 8765] [--target 1.5]
+
+The run fails (exit code 1) when the median time-to-first-request is above the
+target, so it can be used as a regression check.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Target time-to-first-request per worker, in seconds.
+DEFAULT_TARGET_SECONDS = float(os.getenv("STARTUP_TARGET_SECONDS", "1.5"))
+
+
+def measure_import_time():
+    """Import main.py in a fresh interpreter and return the wall time in seconds."""
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_first_request(port, timeout=30.0):
+    """Start a uvicorn worker and return seconds until /health first succeeds."""
+    env = dict(os.environ, WARM_LLM_ON_STARTUP="1")
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/health", timeout=0.5).ok:
+                    return time.perf_counter() - start
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"Worker did not answer within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET_SECONDS,
+                        help="Target time-to-first-request in seconds")
+    args = parser.parse_args()
+
+    import_times = [measure_import_time() for _ in range(args.runs)]
+    first_request_times = [measure_first_request(args.port) for _ in range(args.runs)]
+
+    import_median = statistics.median(import_times)
+    ttfr_median = statistics.median(first_request_times)
+    print(f"import main:            median {import_median * 1000:.1f} ms (min {min(import_times) * 1000:.1f} ms)")
+    print(f"time-to-first-request:  median {ttfr_median * 1000:.1f} ms (max {max(first_request_times) * 1000:.1f} ms)")
+    print(f"target:                 {args.target * 1000:.0f} ms")
+
+    if ttfr_median > args.target:
+        print("FAIL: time-to-first-request above target")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
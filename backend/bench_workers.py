@@ -0,0 +1,152 @@
+"""Throughput scaling benchmark for the multi-worker server.
+
+Seeds a fresh shared cache with synthetic OpenWeather readings and Overpass
+results for a set of sites, so no upstream is contacted, then starts the
+server with 1, 2, 4, ... worker processes and drives POST /dispersion (a
+CPU-bound request served entirely from the cache) from a pool of client
+threads. Prints requests/second per worker count, the scaling efficiency
+against one worker, and the per-worker cache hit rates from /metrics/cache.
+
+Usage:
+    python bench_workers.py [--workers 1,2,4] [--duration 10] [--sites 20] [--sources 1500]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+CENTER_LAT, CENTER_LON = 19.045, 72.845
+CATEGORIES = ["industrial_works", "power_plant", "fossil_fuel_storage", "transport_fuel",
+              "transport_bus_station", "waste_landfill"]
+
+
+def seed_cache(env, sites, sources, radius):
+    """Write weather and emission-source entries for every site into a fresh cache file.
+
+    Returns the SharedCache, used afterwards to reset hit-rate stats between runs.
+    """
+    os.environ.update(env)
+    import main
+
+    rng = np.random.default_rng(0)
+    for lat, lon in sites:
+        weather = {
+            "main": {"temp": 30.0, "feels_like": 33.0, "humidity": 70, "pressure": 1008},
+            "wind": {"speed": float(rng.uniform(1, 8)), "deg": float(rng.uniform(0, 360))},
+            "clouds": {"all": 40},
+            "weather": [{"description": "haze", "icon": "50d"}],
+            "name": "Benchmark", "dt": int(time.time()), "visibility": 4000,
+        }
+        main.shared_cache.set("openweather", main.openweather_cache_key("weather", lat, lon), weather, 86400)
+
+        spread = radius / main.MAX_SEARCH_RADIUS * 0.09
+        table = main.new_poi_table()
+        for i in range(sources):
+            table.append(str(rng.choice(CATEGORIES)), "node", i + 1,
+                         float(lat + rng.uniform(-spread, spread)), float(lon + rng.uniform(-spread, spread)), {})
+        query = main.build_emission_query(lat, lon, radius)
+        main.shared_cache.set("overpass", query, table.to_columns(), 86400)
+    return main.shared_cache
+
+
+def start_server(workers, port, env):
+    proc = subprocess.Popen(
+        [sys.executable, "main.py", "--workers", str(workers), "--port", str(port), "--host", "127.0.0.1"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.perf_counter() + 60
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=0.5).ok:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"Server with {workers} workers did not start")
+
+
+def drive(port, sites, radius, max_elements, grid, concurrency, duration):
+    """Send dispersion requests from ``concurrency`` threads for ``duration`` seconds. Returns requests/s."""
+    url = f"http://127.0.0.1:{port}/dispersion"
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        session = requests.Session()
+        done = 0
+        while time.perf_counter() < deadline:
+            lat, lon = sites[(index + done) % len(sites)]
+            response = session.post(url, json={
+                "latitude": lat, "longitude": lon, "radius": radius,
+                "max_elements": max_elements, "grid_size": grid,
+            })
+            response.raise_for_status()
+            done += 1
+        return done
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        completed = sum(pool.map(client, range(concurrency)))
+    return completed / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cpus = os.cpu_count() or 1
+    default_workers = ",".join(str(n) for n in (1, 2, 4, 8, 16) if n <= cpus) or "1"
+    parser.add_argument("--workers", default=default_workers, help="Comma-separated worker counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per worker count")
+    parser.add_argument("--sites", type=int, default=20)
+    parser.add_argument("--sources", type=int, default=1500, help="Emission sources per site")
+    parser.add_argument("--radius", type=int, default=5000)
+    parser.add_argument("--grid", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    sites = [(round(CENTER_LAT + rng.uniform(-0.5, 0.5), 4), round(CENTER_LON + rng.uniform(-0.5, 0.5), 4))
+             for _ in range(args.sites)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server_env = {"SHARED_CACHE_PATH": os.path.join(tmp, "cache.db"),
+                      "JOBS_DB_PATH": os.path.join(tmp, "jobs.db"), "WARM_LLM_ON_STARTUP": "0"}
+        shared_cache = seed_cache(server_env, sites, args.sources, args.radius)
+        env = dict(os.environ, **server_env)
+
+        print(f"{cpus} CPUs; /dispersion with {args.sources} sources on a {args.grid}x{args.grid} grid")
+        baseline = None
+        for workers in [int(n) for n in args.workers.split(",")]:
+            shared_cache.clear_stats()
+            proc = start_server(workers, args.port, env)
+            try:
+                concurrency = workers * 2
+                # Warm every worker (lazy imports, first cache reads) before timing
+                drive(args.port, sites, args.radius, args.sources, args.grid, concurrency, 2.0)
+                rate = drive(args.port, sites, args.radius, args.sources, args.grid, concurrency, args.duration)
+                cache = requests.get(f"http://127.0.0.1:{args.port}/metrics/cache").json()
+            finally:
+                proc.terminate()
+                proc.wait()
+            baseline = baseline or rate
+            efficiency = rate / (baseline * workers)
+            print(f"{workers:>3} workers: {rate:7.2f} req/s  speedup {rate / baseline:5.2f}x  "
+                  f"efficiency {efficiency:.0%}")
+            for pid, namespaces in sorted(cache["workers"].items()):
+                print(f"      pid {pid}: " + ", ".join(
+                    f"{ns} {stats['hit_rate']:.0%} of {stats['hits'] + stats['misses']}"
+                    for ns, stats in sorted(namespaces.items()) if stats["hit_rate"] is not None
+                ))
+
+
+if __name__ == "__main__":
+    main()
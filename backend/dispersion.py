@@ -0,0 +1,250 @@
+"""Gaussian-plume dispersion of classified emission sources.
+
+Computes a relative ground-level concentration field over a regular grid from
+point sources, using the live wind speed and direction and a Pasquill-Gifford
+stability class. Dispersion widths follow the Briggs rural formulas.
+
+The computation is vectorized over sources x grid cells with NumPy. Grid
+cells are processed in chunks so that the temporary (sources x cells) arrays
+stay under a fixed memory budget whatever the number of sources. Each chunk
+only evaluates the sources that can reach it: upwind of it and within a few
+plume widths crosswind.
+
+Emission rates are relative weights per super-category, not measured
+emissions, so the field is an indicator of where emissions accumulate
+downwind rather than a calibrated concentration.
+"""
+import base64
+import math
+import zlib
+
+import numpy as np
+
+# Relative emission weight per super-category (arbitrary units per second)
+EMISSION_WEIGHTS = {
+    "power": 20.0,
+    "industrial": 10.0,
+    "fossil_fuel": 5.0,
+    "waste": 4.0,
+    "transportation": 3.0,
+    "fuel_station": 1.0,
+    "other": 1.0,
+}
+
+# Typical effective release height per super-category, in metres
+RELEASE_HEIGHTS = {
+    "power": 80.0,
+    "industrial": 30.0,
+    "fossil_fuel": 10.0,
+    "waste": 5.0,
+    "transportation": 5.0,
+    "fuel_station": 3.0,
+    "other": 5.0,
+}
+
+STABILITY_CLASSES = "ABCDEF"
+
+# Briggs (1973) open-country coefficients:
+#   sigma_y = a * x / sqrt(1 + 0.0001 x)
+#   sigma_z = b * x * (1 + c x) ** d
+_BRIGGS_SIGMA_Y = {"A": 0.22, "B": 0.16, "C": 0.11, "D": 0.08, "E": 0.06, "F": 0.04}
+_BRIGGS_SIGMA_Z = {
+    "A": (0.20, 0.0, 0.0),
+    "B": (0.12, 0.0, 0.0),
+    "C": (0.08, 0.0002, -0.5),
+    "D": (0.06, 0.0015, -0.5),
+    "E": (0.03, 0.0003, -1.0),
+    "F": (0.016, 0.0003, -1.0),
+}
+
+MIN_WIND_SPEED = 0.5  # m/s; the plume model breaks down in calm conditions
+MIN_DOWNWIND_DISTANCE = 1.0  # m; avoid the singularity at the source
+# Sources further than this many sigma_y crosswind from a cell are skipped;
+# their contribution is below exp(-12.5), about 4e-6 of the plume centerline
+CROSSWIND_CUTOFF = 5.0
+EARTH_METRES_PER_DEGREE = 111320.0
+
+# Upper bound for the size of each temporary (sources x cells) array. Small
+# enough to stay in CPU cache, which matters more than fewer numpy calls.
+DEFAULT_CHUNK_BYTES = 512 * 1024
+
+
+def stability_class(wind_speed, is_daytime=True, cloud_cover=None):
+    """Pasquill-Gifford stability class from surface wind speed (m/s), day/night and cloud cover (%).
+
+    Daytime assumes moderate insolation. At night, more than half cloud cover
+    counts as overcast.
+    """
+    u = wind_speed or 0.0
+    if is_daytime:
+        if u < 3:
+            return "B"
+        if u < 6:
+            return "C"
+        return "D"
+    overcast = cloud_cover is not None and cloud_cover > 50
+    if u < 3:
+        return "E" if overcast else "F"
+    if u < 5:
+        return "D" if overcast else "E"
+    return "D"
+
+
+def sources_from_categories(lat, lon, super_categories, weights=EMISSION_WEIGHTS, heights=RELEASE_HEIGHTS):
+    """Build (lat, lon, q, h) arrays from coordinate buffers and per-source super-category names."""
+    q = np.fromiter((weights.get(sc, weights["other"]) for sc in super_categories), dtype=np.float64)
+    h = np.fromiter((heights.get(sc, heights["other"]) for sc in super_categories), dtype=np.float64)
+    return np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64), q, h
+
+
+def grid_bounds(center_lat, center_lon, radius):
+    """(west, south, east, north) of the square of half-width ``radius`` metres around a point."""
+    dlat = radius / EARTH_METRES_PER_DEGREE
+    dlon = radius / (EARTH_METRES_PER_DEGREE * max(math.cos(math.radians(center_lat)), 0.01))
+    return center_lon - dlon, center_lat - dlat, center_lon + dlon, center_lat + dlat
+
+
+def concentration_field(src_lat, src_lon, q, h, center_lat, center_lon, radius, grid_size,
+                        wind_speed, wind_direction, stability="D", chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Ground-level concentration on a ``grid_size`` x ``grid_size`` grid covering ``radius`` metres around the center.
+
+    ``wind_direction`` is meteorological (degrees the wind blows from,
+    clockwise from north). Returns a float32 array of shape
+    (grid_size, grid_size), row 0 being the northern edge.
+    """
+    if stability not in _BRIGGS_SIGMA_Y:
+        raise ValueError(f"Unknown stability class: {stability!r}")
+    if len(q) == 0:
+        return np.zeros((grid_size, grid_size), dtype=np.float32)
+
+    # Local planar coordinates in metres, centered on the grid center
+    metres_per_deg_lon = EARTH_METRES_PER_DEGREE * math.cos(math.radians(center_lat))
+    sx = ((np.asarray(src_lon) - center_lon) * metres_per_deg_lon).astype(np.float32)
+    sy = ((np.asarray(src_lat) - center_lat) * EARTH_METRES_PER_DEGREE).astype(np.float32)
+
+    # Unit vector the plume travels along (opposite of where the wind comes from)
+    theta = math.radians(wind_direction or 0.0)
+    ux, uy = -math.sin(theta), -math.cos(theta)
+
+    # Rotate sources into the wind frame once (along, across) and sort them by
+    # the along-wind coordinate, so each chunk of cells only looks at the
+    # prefix of sources that lie upwind of it
+    s_along = sx * ux + sy * uy
+    order = np.argsort(s_along, kind="stable")
+    s_along = s_along[order][:, None]
+    s_across = (-sx * uy + sy * ux)[order][:, None]
+    u = max(wind_speed or 0.0, MIN_WIND_SPEED)
+    amplitude = (np.asarray(q, dtype=np.float32)[order] / (np.pi * u))[:, None]
+    half_h2 = (0.5 * np.asarray(h, dtype=np.float32)[order] ** 2)[:, None]
+
+    a_y = _BRIGGS_SIGMA_Y[stability]
+    b_z, c_z, d_z = _BRIGGS_SIGMA_Z[stability]
+    # 1 / (sigma_y^2 x^-2) and 1 / (sigma_z^2 x^-2) factors, and 1 / (a b)
+    inv_ay2 = np.float32(1.0 / (a_y * a_y))
+    inv_bz2 = np.float32(1.0 / (b_z * b_z))
+    inv_ab = np.float32(1.0 / (a_y * b_z))
+
+    # Cell centers, row-major from the north-west corner. They are visited in
+    # thin along-wind bands, sorted crosswind within each band, so every chunk
+    # covers a small patch of the wind frame
+    cell = 2.0 * radius / grid_size
+    coords = (np.arange(grid_size, dtype=np.float32) + 0.5) * cell - radius
+    gx = np.tile(coords, grid_size)
+    gy = np.repeat(coords[::-1], grid_size)
+    g_along = gx * ux + gy * uy
+    g_across = -gx * uy + gy * ux
+    band = np.floor((g_along - g_along.min()) / cell).astype(np.int32)
+    cell_order = np.lexsort((g_across, band))
+    g_along = g_along[cell_order]
+    g_across = g_across[cell_order]
+    s_along_flat = s_along[:, 0]
+    s_across_flat = s_across[:, 0]
+
+    n_cells = grid_size * grid_size
+    chunk = max(1, int(chunk_bytes // (4 * len(q))))
+    sorted_field = np.zeros(n_cells, dtype=np.float32)
+    for start in range(0, n_cells, chunk):
+        stop = min(start + chunk, n_cells)
+        chunk_along = g_along[start:stop]
+        chunk_across = g_across[start:stop]
+
+        # Sources at or downwind of every cell in this chunk contribute nothing
+        n_upwind = int(np.searchsorted(s_along_flat, chunk_along.max() - MIN_DOWNWIND_DISTANCE))
+        if n_upwind == 0:
+            continue
+        # Neither do sources more than CROSSWIND_CUTOFF sigma_y off to the side
+        x_max = float(chunk_along.max() - s_along_flat[0])
+        reach = CROSSWIND_CUTOFF * a_y * x_max / math.sqrt(1 + 0.0001 * x_max)
+        candidates = s_across_flat[:n_upwind]
+        selected = np.nonzero(
+            (candidates > chunk_across.min() - reach) & (candidates < chunk_across.max() + reach)
+        )[0]
+        if len(selected) == 0:
+            continue
+
+        x = chunk_along[None, :] - s_along[selected]
+        y = chunk_across[None, :] - s_across[selected]
+        downwind = x > MIN_DOWNWIND_DISTANCE
+        np.maximum(x, MIN_DOWNWIND_DISTANCE, out=x)
+
+        # sigma_y^2 = a^2 x^2 / gy,  gy = 1 + 0.0001 x
+        # sigma_z^2 = b^2 x^2 * gz,  gz = (1 + c x)^(2d)
+        x2 = x * x
+        fy = 1 + np.float32(0.0001) * x
+        if d_z == -0.5:
+            fz = 1 / (1 + np.float32(c_z) * x)
+        elif d_z == -1.0:
+            fz = 1 / (1 + np.float32(c_z) * x)
+            fz *= fz
+        else:
+            fz = np.ones_like(x)
+
+        # exponent = -(y^2 / sigma_y^2 + H^2 / sigma_z^2) / 2
+        y *= y
+        y *= fy
+        y *= inv_ay2
+        exponent = half_h2[selected] * inv_bz2 / fz
+        exponent += np.float32(0.5) * y
+        exponent /= x2
+        np.negative(exponent, out=exponent)
+        np.exp(exponent, out=exponent)
+
+        # 1 / (sigma_y sigma_z) = sqrt(gy / gz) / (a b x^2)
+        fy /= fz
+        np.sqrt(fy, out=fy)
+        exponent *= fy
+        exponent /= x2
+        exponent *= amplitude[selected]
+        exponent *= downwind
+
+        sorted_field[start:stop] = exponent.sum(axis=0)
+
+    field = np.empty(n_cells, dtype=np.float32)
+    field[cell_order] = sorted_field * inv_ab
+    return field.reshape(grid_size, grid_size)
+
+
+def encode_raster(field, bounds, decades=3):
+    """Pack a concentration field into a compact JSON-friendly raster.
+
+    Values are log-scaled relative to the maximum over ``decades`` orders of
+    magnitude and quantized to one byte per cell (0 = below range), then
+    zlib-compressed and base64-encoded. Decode with:
+        c = max * 10 ** (decades * (q / 255 - 1)) for q > 0
+    """
+    peak = float(field.max()) if field.size else 0.0
+    if peak > 0:
+        with np.errstate(divide="ignore"):
+            scaled = (np.log10(field / peak) / decades + 1.0) * 255.0
+        quantized = np.clip(np.nan_to_num(scaled, neginf=0.0), 0, 255).round().astype(np.uint8)
+    else:
+        quantized = np.zeros(field.shape, dtype=np.uint8)
+    return {
+        "width": int(field.shape[1]),
+        "height": int(field.shape[0]),
+        "bounds": [round(v, 6) for v in bounds],
+        "encoding": "uint8-log-zlib-base64",
+        "decades": decades,
+        "max": peak,
+        "data": base64.b64encode(zlib.compress(quantized.tobytes(), 6)).decode("ascii"),
+    }
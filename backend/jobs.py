@@ -0,0 +1,262 @@
+"""Background job queue for long-running area analyses.
+
+Jobs are persisted in a local SQLite database so that queued or running work
+survives a worker restart: on startup, anything left in the "queued" or
+"running" state by a process that is no longer alive is put back on the
+queue. Each job records the pid of the process running it, so with several
+server workers sharing the database, a starting worker does not take over
+jobs that another live worker is still running. A bounded thread pool runs
+the pipeline; the per-upstream concurrency caps live in main.py and apply here
+too. Finished jobs, results included, are deleted ``result_ttl`` seconds
+after they finish.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from shared_cache import process_alive
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+FINISHED_STATES = (DONE, FAILED)
+
+
+class QueueFullError(Exception):
+    """Raised when the number of pending jobs is at the configured limit."""
+
+
+class JobQueue:
+    """Persistent job queue with a bounded worker pool.
+
+    ``runner`` is called with the job payload dict and must return a result
+    that ``serializer`` can turn into JSON, or raise. HTTPException details
+    are kept as the job error so clients see the same message as the
+    synchronous route.
+    """
+
+    def __init__(self, db_path, runner, max_workers=2, max_pending=100, serializer=json.dumps,
+                 result_ttl=86400, purge_interval=3600):
+        self.db_path = db_path
+        self.runner = runner
+        self.serializer = serializer
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.purge_interval = purge_interval
+        self._executor = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        # (event loop, asyncio.Event) per event-stream subscriber
+        self._waiters = set()
+        self._init_db()
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open a connection for one transaction and close it afterwards."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner_pid" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status)")
+
+    def start(self):
+        """Start the worker pool, purge expired results and requeue jobs whose owning process has died."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self.purge_finished()
+        pid = os.getpid()
+        claimed = []
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, owner_pid FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING),
+            ).fetchall()
+            for row in rows:
+                # A row owned by our own pid was left by an earlier process that had the same pid
+                if process_alive(row["owner_pid"], count_self=False):
+                    continue
+                # Several workers may start at once; only one wins each job
+                updated = conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = NULL, owner_pid = ? "
+                    "WHERE id = ? AND status IN (?, ?) AND owner_pid IS ?",
+                    (QUEUED, pid, row["id"], QUEUED, RUNNING, row["owner_pid"]),
+                ).rowcount
+                if updated:
+                    claimed.append(row["id"])
+        for job_id in claimed:
+            self._executor.submit(self._run, job_id)
+        if claimed:
+            print(f"Requeued {len(claimed)} unfinished job(s)")
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def purge_finished(self):
+        """Delete finished jobs older than ``result_ttl``. Returns the number deleted."""
+        self._last_purge = time.monotonic()
+        with self._connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (*FINISHED_STATES, time.time() - self.result_ttl),
+            ).rowcount
+        if deleted:
+            print(f"Purged {deleted} finished job(s)")
+        return deleted
+
+    def _maybe_purge(self):
+        if time.monotonic() - self._last_purge >= self.purge_interval:
+            self.purge_finished()
+
+    def pending_count(self):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchone()[0]
+
+    def submit(self, payload):
+        """Persist a new job and schedule it. Returns the job id."""
+        if self.pending_count() >= self.max_pending:
+            raise QueueFullError(f"Job queue is full ({self.max_pending} pending)")
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at, owner_pid) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), time.time(), os.getpid()),
+            )
+        self.start()
+        self._executor.submit(self._run, job_id)
+        self._maybe_purge()
+        return job_id
+
+    def get(self, job_id, include_result=True):
+        """Return the job as a dict, or None if it does not exist."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row["id"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+        if row["error"]:
+            job["error"] = row["error"]
+        if include_result and row["result"]:
+            job["result"] = json.loads(row["result"])
+        return job
+
+    def status(self, job_id):
+        """Return just the job's status, or None if it does not exist."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    async def wait_for_change(self, job_id, last_status, timeout, poll_interval=1.0):
+        """Wait until the job's status differs from ``last_status`` or timeout expires.
+
+        Returns the current status (None if the job does not exist). Waits on the
+        event loop without holding a threadpool thread: it wakes when this
+        process updates a job, and re-reads the status every ``poll_interval``
+        seconds in case another worker process did. The reads run in asyncio's
+        default executor, not the request threadpool.
+        """
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            deadline = loop.time() + timeout
+            while True:
+                waiter[1].clear()
+                status = await asyncio.to_thread(self.status, job_id)
+                if status != last_status:
+                    return status
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return status
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), min(remaining, poll_interval))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def _notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                pass
+
+    def _set_status(self, job_id, status, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        sql = f"UPDATE jobs SET status = ?{', ' + columns if columns else ''} WHERE id = ?"
+        with self._connect() as conn:
+            conn.execute(sql, (status, *fields.values(), job_id))
+        self._notify()
+
+    def _run(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["status"] in FINISHED_STATES:
+            return
+        self._set_status(job_id, RUNNING, started_at=time.time())
+        print(f"Job {job_id} started")
+        try:
+            result = self.runner(json.loads(row["payload"]))
+            self._set_status(job_id, DONE, result=self.serializer(result), finished_at=time.time())
+            print(f"Job {job_id} finished")
+        except HTTPException as e:
+            self._set_status(job_id, FAILED, error=str(e.detail), finished_at=time.time())
+            print(f"Job {job_id} failed: {e.detail}")
+        except Exception as e:
+            self._set_status(job_id, FAILED, error=f"Unexpected error: {str(e)}", finished_at=time.time())
+            print(f"Job {job_id} failed: {str(e)}")
+        self._maybe_purge()
+
@@ -0,0 +1,304 @@
+"""Single owner of all Gemini calls.
+
+Every model call goes through LLMScheduler.generate(), which:
+  - enforces requests/minute and tokens/minute with token buckets,
+  - caps the number of calls in flight and the number waiting; callers can
+    also give a queue timeout, so overload fails fast instead of piling up,
+  - serves waiting calls by priority class (user-facing summary first,
+    background enrichment last), FIFO within a class,
+  - retries rate-limit and transient errors with jittered exponential backoff,
+  - records per-call latency and token usage for the /metrics/llm endpoint,
+  - optionally answers repeated prompts from a SharedCache, so identical
+    prompts from any worker process cost one model call.
+
+Callers block until their call completes, so the call sites keep their
+synchronous shape.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+
+PRIORITY_SUMMARY = 0
+PRIORITY_HEALTH = 1
+PRIORITY_ENRICHMENT = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_SUMMARY: "summary",
+    PRIORITY_HEALTH: "health",
+    PRIORITY_ENRICHMENT: "enrichment",
+}
+
+# Exception names (google.api_core / grpc) and message fragments that mean
+# "try again later" rather than "this request is broken"
+_RETRYABLE_NAMES = ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                    "DeadlineExceeded", "InternalServerError", "Timeout")
+_RETRYABLE_TEXT = ("429", "503", "rate limit", "quota", "temporarily unavailable")
+
+# How often the first caller in line re-tries a ``slot`` held elsewhere
+_SLOT_POLL_INTERVAL = 0.1
+
+
+class LLMQueueTimeout(Exception):
+    """Raised when a call waited in the queue longer than its timeout."""
+
+
+class LLMQueueFull(LLMQueueTimeout):
+    """Raised when ``max_queue`` calls are already waiting."""
+
+
+def estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token) used before the call is made."""
+    return max(1, len(text) // 4)
+
+
+def is_retryable(error):
+    name = type(error).__name__
+    if any(part in name for part in _RETRYABLE_NAMES):
+        return True
+    message = str(error).lower()
+    return any(part in message for part in _RETRYABLE_TEXT)
+
+
+class TokenBucket:
+    """Classic token bucket; ``rate_per_minute`` tokens refill continuously up to ``capacity``."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` tokens are available (0 if available now)."""
+        self._refill()
+        # A single request larger than the bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+    def try_take(self, amount):
+        """Take ``amount`` tokens if available and return 0, else return seconds to wait."""
+        wait = self.wait_time(amount)
+        if wait == 0:
+            self.tokens -= amount
+        return wait
+
+    def adjust(self, delta):
+        """Correct an earlier estimate once the real usage is known (may go negative)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class CachedResponse:
+    """Stand-in for a model response served from the cache; only ``text`` is kept."""
+
+    usage_metadata = None
+
+    def __init__(self, text):
+        self.text = text
+
+
+class LLMScheduler:
+    def __init__(self, model_factory, requests_per_minute=30, tokens_per_minute=1_000_000,
+                 max_concurrency=4, max_retries=4, base_delay=1.0, max_delay=30.0,
+                 output_token_estimate=512, max_queue=64, cache=None, cache_ttl=86400, cache_tag="",
+                 request_bucket=None, token_bucket=None, slot=None):
+        self.model_factory = model_factory
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        # Part of every cache key, e.g. the model name, so a model change does not reuse old answers
+        self.cache_tag = cache_tag
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.output_token_estimate = output_token_estimate
+        # Buckets and ``slot`` (a semaphore held around each model call) may be
+        # shared across processes; by default they are local to this one
+        self._request_bucket = request_bucket or TokenBucket(requests_per_minute)
+        self._token_bucket = token_bucket or TokenBucket(tokens_per_minute)
+        self.slot = slot
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._metrics = {
+            name: {
+                "calls": 0, "errors": 0, "retries": 0, "cache_hits": 0, "rejected": 0,
+                "prompt_tokens": 0, "output_tokens": 0,
+                "queue_wait_seconds": 0.0,
+                "latencies": deque(maxlen=500),
+            }
+            for name in PRIORITY_NAMES.values()
+        }
+
+    def generate(self, prompt, priority=PRIORITY_ENRICHMENT, timeout=None):
+        """Run ``model.generate_content(prompt)`` under the scheduler and return the response.
+
+        Raises LLMQueueFull if the queue is full, and LLMQueueTimeout if no
+        slot was free within ``timeout`` seconds (which covers retries too).
+        """
+        stats = self._metrics[PRIORITY_NAMES[priority]]
+        if self.cache is not None:
+            text = self.cache.get("llm", [self.cache_tag, prompt])
+            if text is not None:
+                with self._cond:
+                    stats["cache_hits"] += 1
+                return CachedResponse(text)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        estimate = estimate_tokens(prompt) + self.output_token_estimate
+        seq = next(self._seq)
+        attempt = 0
+        while True:
+            try:
+                waited, slot = self._acquire(priority, seq, estimate, deadline)
+            except LLMQueueTimeout:
+                with self._cond:
+                    stats["rejected"] += 1
+                raise
+            start = time.monotonic()
+            try:
+                response = self.model_factory().generate_content(prompt)
+            except Exception as e:
+                self._release(slot)
+                with self._cond:
+                    stats["queue_wait_seconds"] += waited
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        stats["errors"] += 1
+                        raise
+                    stats["retries"] += 1
+                attempt += 1
+                # Full jitter: sleep a random time up to the exponential cap
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                print(f"LLM call failed ({type(e).__name__}), retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            latency = time.monotonic() - start
+            self._release(slot)
+            self._record(stats, prompt, response, estimate, latency, waited)
+            if self.cache is not None:
+                self._store(prompt, response)
+            return response
+
+    def _store(self, prompt, response):
+        try:
+            text = response.text
+        except Exception:
+            # Blocked or empty candidates have no text; nothing worth caching
+            return
+        if text:
+            self.cache.set("llm", [self.cache_tag, prompt], text, self.cache_ttl)
+
+    def _acquire(self, priority, seq, estimate, deadline):
+        """Block until this call is first in line and within limits.
+
+        Returns (seconds waited, the ``slot`` taken or None); pass the slot to _release().
+        """
+        entry = (priority, seq)
+        start = time.monotonic()
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise LLMQueueFull(f"LLM queue is full ({self.max_queue} waiting)")
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    wait = None
+                    if self._queue[0] == entry and self._in_flight < self.max_concurrency:
+                        # The slot is only tried, never waited on, so the
+                        # deadline below still applies while another process holds it
+                        slot = self.slot
+                        if slot is not None and not slot.acquire(blocking=False):
+                            wait = _SLOT_POLL_INTERVAL
+                        else:
+                            try:
+                                wait = self._take_tokens(estimate)
+                            finally:
+                                # Hand the slot back if the budget is short (or the take failed)
+                                if wait != 0 and slot is not None:
+                                    slot.release()
+                        if wait == 0:
+                            heapq.heappop(self._queue)
+                            self._in_flight += 1
+                            # The next caller in line may be able to go too
+                            self._cond.notify_all()
+                            return time.monotonic() - start, slot
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise LLMQueueTimeout("Timed out waiting for an LLM slot")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            except BaseException:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                raise
+
+    def _take_tokens(self, estimate):
+        """Take from both buckets atomically each, refunding the request token if the token budget is short."""
+        wait = self._request_bucket.try_take(1)
+        if wait == 0:
+            wait = self._token_bucket.try_take(estimate)
+            if wait > 0:
+                self._request_bucket.adjust(-1)
+        return wait
+
+    def _release(self, slot):
+        if slot is not None:
+            slot.release()
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _record(self, stats, prompt, response, estimate, latency, waited):
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt)
+        output_tokens = getattr(usage, "candidates_token_count", None)
+        if output_tokens is None:
+            output_tokens = estimate_tokens(getattr(response, "text", "") or "")
+        with self._cond:
+            self._token_bucket.adjust(prompt_tokens + output_tokens - estimate)
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["output_tokens"] += output_tokens
+            stats["queue_wait_seconds"] += waited
+            stats["latencies"].append(latency)
+
+    def metrics(self):
+        """Snapshot of per-priority call counts, token totals and latency percentiles."""
+        with self._cond:
+            result = {
+                "in_flight": self._in_flight,
+                "queued": len(self._queue),
+                "classes": {},
+            }
+            for name, stats in self._metrics.items():
+                latencies = sorted(stats["latencies"])
+                result["classes"][name] = {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "retries": stats["retries"],
+                    "rejected": stats["rejected"],
+                    "cache_hits": stats["cache_hits"],
+                    "prompt_tokens": stats["prompt_tokens"],
+                    "output_tokens": stats["output_tokens"],
+                    "queue_wait_seconds": round(stats["queue_wait_seconds"], 3),
+                    "latency_p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                    "latency_p95": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+                }
+            return result
@@ -1,13 +1,21 @@
 import os
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-import google.generativeai as genai
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
 import json
 import requests
 import math
+import threading
 from urllib.parse import quote
 from datetime import datetime
+from jobs import JobQueue, QueueFullError, FINISHED_STATES
+from overpass_stream import iter_response_elements
+from poi_table import PoiTable, LazyView, json_default
+from llm_scheduler import LLMScheduler, LLMQueueTimeout, PRIORITY_SUMMARY, PRIORITY_HEALTH, PRIORITY_ENRICHMENT
+from tiles import TILE_ZOOM, TileStore, etag_matches, parse_tile_key, tile_key, tiles_covering
+from shared_cache import SharedCache, SharedSemaphore, SharedTokenBucket
 
 load_dotenv()
 
@@ -19,22 +27,425 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The tile routes' ETag is what clients send back in If-None-Match and "have"
+    expose_headers=["ETag"],
 )
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel('gemini-2.0-flash-lite')
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite")
 
-def get_pois_overpass(area_name, city_name, poi_categories):
-    """Get POIs using Overpass API for multiple categories within a 1km radius."""
-    overpass_url = "https://overpass-api.de/api/interpreter"
+# The Gemini client is created on first use instead of at import time.
+# Importing google.generativeai pulls in grpc and protobuf, which made every
+# worker slow to start and heavier in memory before it served a single request.
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Return the shared Gemini model, configuring the client on first call."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                _model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return _model
+
+@app.on_event("startup")
+async def warm_clients():
+    """Warm the Gemini client in the background so the worker accepts traffic immediately."""
+    if os.getenv("WARM_LLM_ON_STARTUP", "1") == "1":
+        threading.Thread(target=_warm_model, name="warm-llm", daemon=True).start()
+
+def _warm_model():
+    try:
+        get_model()
+        print("Gemini client ready")
+    except Exception as e:
+        # A failed warm-up is not fatal; the first request will retry.
+        print(f"Gemini warm-up failed: {str(e)}")
+
+@app.get("/health")
+async def health():
+    """Cheap liveness probe, also used by the startup benchmark."""
+    return {"status": "ok", "llm_ready": _model is not None}
+
+# Upstream results are cached in a SQLite file shared by every worker process
+# (and the batch CLI), so each geocode, Overpass result, weather reading and
+# LLM answer is fetched once rather than once per worker.
+shared_cache = SharedCache(
+    os.getenv("SHARED_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache.db")),
+    enabled=os.getenv("SHARED_CACHE", "1") == "1",
+)
+
+# Concurrency caps per upstream service. Every outbound call takes a slot from
+# the matching semaphore, so a burst of analyses queues here instead of
+# hammering Overpass/Nominatim/Gemini and tripping their rate limits.
+# With the shared cache enabled the semaphores live in its database, so the
+# caps hold across all server workers (and a batch run on the same host);
+# otherwise they are per process.
+UPSTREAM_LIMITS = {
+    "nominatim": int(os.getenv("NOMINATIM_CONCURRENCY", "1")),
+    "overpass": int(os.getenv("OVERPASS_CONCURRENCY", "2")),
+    "openweather": int(os.getenv("OPENWEATHER_CONCURRENCY", "8")),
+}
+
+def _new_semaphore(name, limit):
+    if shared_cache.enabled:
+        return SharedSemaphore(shared_cache, name, limit)
+    return threading.BoundedSemaphore(limit)
+
+_upstream_semaphores = {name: _new_semaphore(name, limit) for name, limit in UPSTREAM_LIMITS.items()}
+
+def set_upstream_limit(name, limit):
+    """Change the concurrency cap for one upstream (used by the batch CLI)."""
+    UPSTREAM_LIMITS[name] = limit
+    _upstream_semaphores[name] = _new_semaphore(name, limit)
+
+def upstream_slot(name):
+    """Context manager holding one concurrency slot for the named upstream."""
+    return _upstream_semaphores[name]
+
+def fetch_json(upstream, url, **kwargs):
+    """GET ``url`` under the upstream's concurrency cap and return the decoded JSON body."""
+    with upstream_slot(upstream):
+        response = requests.get(url, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 86400)))
+OVERPASS_CACHE_TTL = int(os.getenv("OVERPASS_CACHE_TTL", "3600"))
+# Larger Overpass results are not cached: serializing them would hold a
+# second copy of the result in memory while it is written
+OVERPASS_CACHE_MAX_ELEMENTS = int(os.getenv("OVERPASS_CACHE_MAX_ELEMENTS", "5000"))
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+# OpenWeather readings are shared between points within about 1 km
+WEATHER_CACHE_PRECISION = 2
+
+def openweather_cache_key(endpoint, lat, lon):
+    return [endpoint, round(float(lat), WEATHER_CACHE_PRECISION), round(float(lon), WEATHER_CACHE_PRECISION)]
+
+@app.on_event("startup")
+async def start_shared_cache():
+    shared_cache.reset_worker_stats()
+
+@app.on_event("shutdown")
+async def stop_shared_cache():
+    shared_cache.flush_stats()
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    """Shared-cache hit rates per worker process and namespace."""
+    return {"worker_pid": os.getpid(), **shared_cache.all_stats()}
+
+# All Gemini calls go through one scheduler: rate limits, priorities, retries
+# and metrics live there instead of at each call site. Like the upstream caps,
+# the RPM/TPM buckets and the concurrency cap are shared by all workers when
+# the shared cache is enabled.
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "30"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+
+llm_scheduler = LLMScheduler(
+    get_model,
+    requests_per_minute=GEMINI_RPM,
+    tokens_per_minute=GEMINI_TPM,
+    max_concurrency=GEMINI_CONCURRENCY,
+    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "4")),
+    max_queue=int(os.getenv("GEMINI_MAX_QUEUE", "64")),
+    cache=shared_cache,
+    cache_ttl=LLM_CACHE_TTL,
+    cache_tag=GEMINI_MODEL_NAME,
+    request_bucket=SharedTokenBucket(shared_cache, "gemini_requests", GEMINI_RPM) if shared_cache.enabled else None,
+    token_bucket=SharedTokenBucket(shared_cache, "gemini_tokens", GEMINI_TPM) if shared_cache.enabled else None,
+    slot=_new_semaphore("gemini", GEMINI_CONCURRENCY) if shared_cache.enabled else None,
+)
+
+def set_llm_concurrency(limit):
+    """Change the Gemini concurrency cap (used by the batch CLI)."""
+    llm_scheduler.max_concurrency = limit
+    if llm_scheduler.slot is not None:
+        llm_scheduler.slot = _new_semaphore("gemini", limit)
+
+# Longest a call waits for a slot. Enrichment falls back to category defaults,
+# so it gives up sooner than the calls a response cannot do without.
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+LLM_ENRICHMENT_TIMEOUT = float(os.getenv("LLM_ENRICHMENT_TIMEOUT", "15"))
+
+@app.get("/metrics/llm")
+async def llm_metrics():
+    return llm_scheduler.metrics()
+
+def classify_emission_source(tags):
+    """Map OSM tags to an emission-source category, or None if not an emission source."""
+    if 'industrial' in tags:
+        return f"industrial_{tags['industrial']}"
+    elif 'landuse' in tags and tags['landuse'] == 'industrial':
+        return 'industrial_area'
+    elif 'man_made' in tags and tags['man_made'] in ['works', 'chimney']:
+        return f"industrial_{tags['man_made']}"
+    elif 'power' in tags:
+        return f"power_{tags['power']}"
+    elif 'plant:source' in tags:
+        return f"power_plant_{tags['plant:source']}"
+    elif 'man_made' in tags and tags['man_made'] in ['oil_well', 'gas_well', 'storage_tank']:
+        return f"fossil_fuel_{tags['man_made']}"
+    elif 'landuse' in tags and tags['landuse'] in ['quarry', 'mine']:
+        return f"extraction_{tags['landuse']}"
+    elif 'aeroway' in tags:
+        return f"transport_{tags['aeroway']}"
+    elif 'railway' in tags and tags['railway'] == 'yard':
+        return 'transport_railway_yard'
+    elif 'amenity' in tags and tags['amenity'] in ['bus_station', 'parking']:
+        return f"transport_{tags['amenity']}"
+    elif 'amenity' in tags and tags['amenity'] == 'fuel':
+        return "transport_fuel"  # Specific category for fuel stations
+    elif 'landuse' in tags and tags['landuse'] == 'landfill':
+        return 'waste_landfill'
+    elif 'man_made' in tags and tags['man_made'] in ['wastewater_plant', 'waste_transfer_station']:
+        return f"waste_{tags['man_made']}"
+    elif 'amenity' in tags and tags['amenity'] == 'recycling':
+        return 'waste_recycling'
+    return None
+
+def iter_emission_sources(elements):
+    """Yield (category, element_type, osm_id, lat, lon, tags) for each emission source in an iterable of Overpass elements."""
+    for element in elements:
+        tags = element.get('tags', {})
+        
+        # Get coordinates
+        if element['type'] == 'node':
+            lat, lon = element.get('lat'), element.get('lon')
+        else:
+            center = element.get('center', {})
+            lat, lon = center.get('lat'), center.get('lon')
+        
+        if not (lat and lon):
+            continue
+        category = classify_emission_source(tags)
+        if category:
+            yield category, element['type'], element.get('id'), lat, lon, tags
+
+def build_poi_table(elements):
+    """Classify Overpass elements into a new PoiTable."""
+    table = new_poi_table()
+    for source in iter_emission_sources(elements):
+        table.append(*source)
+    return table
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+# Overpass tag filters for the emission sources we collect
+EMISSION_SOURCE_FILTERS = [
+    # 1. Industrial & Manufacturing
+    '["industrial"="oil"]',
+    '["industrial"="gas"]',
+    '["industrial"="gas_plant"]',
+    '["industrial"="refinery"]',
+    '["man_made"="works"]',
+    '["man_made"="chimney"]',
+    # 2. Power Generation
+    '["power"="plant"]',
+    '["plant:source"]',
+    '["power"="substation"]',
+    # 3. Fossil Fuel Extraction & Storage
+    '["man_made"="oil_well"]',
+    '["man_made"="gas_well"]',
+    '["man_made"="storage_tank"]',
+    '["landuse"="quarry"]',
+    '["landuse"="mine"]',
+    # 4. Transportation & Vehicle Emissions
+    '["aeroway"="aerodrome"]',
+    '["railway"="yard"]',
+    '["amenity"="bus_station"]',
+    '["amenity"="fuel"]',
+    # 5. Waste Processing & Landfills
+    '["landuse"="landfill"]',
+    '["man_made"="wastewater_plant"]',
+    '["man_made"="waste_transfer_station"]',
+    '["amenity"="recycling"]',
+]
+
+# Search radius bounds in metres. DEFAULT_SEARCH_RADIUS may be "auto".
+MIN_SEARCH_RADIUS = 500
+MAX_SEARCH_RADIUS = 10000
+DEFAULT_SEARCH_RADIUS = os.getenv("DEFAULT_SEARCH_RADIUS", "5000")
+DEFAULT_MAX_ELEMENTS = int(os.getenv("DEFAULT_MAX_ELEMENTS", "1500"))
+# Hard cap on the per-request element budget, whatever the client asks for
+MAX_ELEMENTS = max(int(os.getenv("MAX_ELEMENTS", "5000")), DEFAULT_MAX_ELEMENTS)
+# In auto mode the Overpass output is also capped, at this multiple of the
+# element budget, as a safety net for areas much denser than the count probe
+# suggests. Overpass truncates in type-then-id order (nodes before ways), so
+# the cap sits well above the budget and truncation is reported, not relied on.
+AUTO_OUTPUT_HEADROOM = int(os.getenv("AUTO_OUTPUT_HEADROOM", "4"))
+
+def build_emission_query(lat, lon, radius, output="out center;", timeout=300):
+    """Build the Overpass query for all emission sources within ``radius`` metres."""
+    return _build_emission_query(f"(around:{radius},{lat},{lon})", output, timeout)
+
+def build_emission_bbox_query(south, west, north, east, output="out center;", timeout=60):
+    """Build the Overpass query for all emission sources inside a bounding box."""
+    return _build_emission_query(f"({south},{west},{north},{east})", output, timeout)
+
+def _build_emission_query(area_filter, output, timeout):
+    clauses = "\n".join(
+        f"        nwr{tag_filter}{area_filter};" for tag_filter in EMISSION_SOURCE_FILTERS
+    )
+    return f"""
+    [out:json][timeout:{timeout}];
+    (
+{clauses}
+    );
+    {output}
+    """
+
+def count_emission_sources(lat, lon, radius):
+    """Count emission sources within ``radius`` metres with an Overpass "out count" probe."""
+    query = build_emission_query(lat, lon, radius, output="out count;", timeout=25)
+
+    def count():
+        with upstream_slot("overpass"):
+            response = requests.post(OVERPASS_URL, data=query)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('remark'):
+            # A timed-out probe reports no elements; do not cache a zero count
+            raise ValueError(f"Overpass remark: {data['remark']}")
+        for element in data.get('elements', []):
+            if element.get('type') == 'count':
+                return int(element.get('tags', {}).get('total', 0))
+        return 0
+
+    return shared_cache.cached("overpass_count", query, OVERPASS_CACHE_TTL, count)
+
+def parse_search_radius(value):
+    """Validate a radius request parameter: "auto" or metres within the allowed bounds."""
+    if value is None or value == "":
+        value = DEFAULT_SEARCH_RADIUS
+    if str(value).lower() == "auto":
+        return "auto"
+    try:
+        radius = int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid radius: {value!r}")
+    if not MIN_SEARCH_RADIUS <= radius <= MAX_SEARCH_RADIUS:
+        raise ValueError(f"Radius must be between {MIN_SEARCH_RADIUS} and {MAX_SEARCH_RADIUS} metres")
+    return radius
+
+def parse_max_elements(value):
+    """Validate a max_elements request parameter; values above MAX_ELEMENTS are clamped to it."""
+    if value is None or value == "":
+        return DEFAULT_MAX_ELEMENTS
+    try:
+        max_elements = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid max_elements: {value!r}")
+    if max_elements <= 0:
+        raise ValueError("max_elements must be positive")
+    return min(max_elements, MAX_ELEMENTS)
+
+def emission_output_limit(search, max_elements):
+    """Element cap for the Overpass output statement, or None for an uncapped fixed radius."""
+    if search['mode'] != "auto":
+        return None
+    return max_elements * AUTO_OUTPUT_HEADROOM
+
+def resolve_search_radius(lat, lon, radius, max_elements):
+    """Return {"radius", "mode", "estimated_count"} for the requested radius.
+
+    In "auto" mode the number of sources within MAX_SEARCH_RADIUS is counted
+    first. Assuming roughly uniform density, the radius that keeps the result
+    under ``max_elements`` is MAX_SEARCH_RADIUS * sqrt(max_elements / count).
+    """
+    radius = parse_search_radius(radius)
+    if radius != "auto":
+        return {"radius": radius, "mode": "fixed", "estimated_count": None}
+    try:
+        count = count_emission_sources(lat, lon, MAX_SEARCH_RADIUS)
+    except Exception as e:
+        # Without a density estimate fall back to the fixed default
+        print(f"Overpass count probe failed: {str(e)}")
+        fallback = DEFAULT_SEARCH_RADIUS if DEFAULT_SEARCH_RADIUS != "auto" else 5000
+        return {"radius": int(fallback), "mode": "auto_fallback", "estimated_count": None}
+    if count <= max_elements:
+        chosen = MAX_SEARCH_RADIUS
+    else:
+        chosen = int(MAX_SEARCH_RADIUS * math.sqrt(max_elements / count))
+    chosen = max(MIN_SEARCH_RADIUS, min(MAX_SEARCH_RADIUS, chosen))
+    estimated = round(count * (chosen / MAX_SEARCH_RADIUS) ** 2)
+    return {"radius": chosen, "mode": "auto", "estimated_count": estimated}
+
+def fetch_emission_sources(lat, lon, radius, max_elements):
+    """Query emission sources around a point. Returns (PoiTable, search info).
+
+    Overpass errors are logged and give an empty table, as before; the search
+    info's "error" is then set to the message (it is None on success). A
+    result that Overpass flagged with a remark (timeout, out of memory) keeps
+    its partial table but also sets "error", and is not cached. The search
+    info's "truncated" is set when the auto-mode output cap was reached.
+    """
+    # Pick the search radius; in adaptive mode a cheap count probe keeps the
+    # result under the element budget
+    search = resolve_search_radius(lat, lon, radius, max_elements)
+    print(f"Search radius {search['radius']} m ({search['mode']})")
+    
+    output_limit = emission_output_limit(search, max_elements)
+    output = "out center;" if output_limit is None else f"out center {output_limit};"
+    overpass_query = build_emission_query(lat, lon, search['radius'], output=output)
+    
+    table = new_poi_table()
+    error = None
+    try:
+        # The classified table is cached in compact column form, keyed by the exact query
+        cached = shared_cache.get("overpass", overpass_query)
+        if cached is not None:
+            table.load_columns(cached)
+        else:
+            # Stream the body and classify elements as they are decoded, so the raw
+            # response is never held in memory as a whole
+            trailer = {}
+            with upstream_slot("overpass"):
+                with requests.post(OVERPASS_URL, data=overpass_query, stream=True) as response:
+                    response.raise_for_status()
+                    table = build_poi_table(iter_response_elements(response, trailer=trailer))
+            if trailer.get('remark'):
+                # Overpass answers timeouts and memory exhaustion with HTTP 200, a
+                # remark and a partial result: report it and do not cache it
+                print(f"Overpass remark: {trailer['remark']}")
+                error = f"Overpass error: {trailer['remark']}"
+            elif len(table) <= OVERPASS_CACHE_MAX_ELEMENTS:
+                shared_cache.set("overpass", overpass_query, table.to_columns(), OVERPASS_CACHE_TTL)
+    except Exception as e:
+        print(f"Error fetching POIs: {str(e)}")
+        error = f"Overpass error: {str(e)}"
+        table = new_poi_table()
+    
+    truncated = output_limit is not None and len(table) >= output_limit
+    if truncated:
+        print(f"Overpass output truncated at {output_limit} elements")
+    search.update(max_elements=max_elements, output_limit=output_limit, truncated=truncated, error=error)
+    return table, search
+
+def get_pois_overpass(area_name, city_name, poi_categories, radius=None, max_elements=None):
+    """Get emission-source POIs from the Overpass API around the geocoded area.
+
+    ``radius`` is in metres, or "auto" to size it from a density probe so that
+    about ``max_elements`` elements are returned.
+    """
+    if radius is None:
+        radius = DEFAULT_SEARCH_RADIUS
+    if max_elements is None:
+        max_elements = DEFAULT_MAX_ELEMENTS
 
     # --- 1. Define Search Area ---
     geocode_query = f"{area_name}, {city_name}"
     geocode_url = f"https://nominatim.openstreetmap.org/search?q={quote(geocode_query)}&format=json&limit=1"
     try:
-        geocode_response = requests.get(geocode_url, headers={'User-Agent': 'MapMind/1.0'})
-        geocode_response.raise_for_status()
-        geocode_data = geocode_response.json()
+        geocode_data = shared_cache.cached(
+            "geocode", geocode_url, GEOCODE_CACHE_TTL,
+            lambda: fetch_json("nominatim", geocode_url, headers={'User-Agent': 'MapMind/1.0'}),
+            cacheable=lambda data: isinstance(data, list) and bool(data)
+        )
     except requests.RequestException as e:
         print(f"Geocoding Error: {str(e)}")
         return {"error": f"Geocoding failed: {str(e)}"}
@@ -60,124 +471,7 @@ def get_pois_overpass(area_name, city_name, poi_categories):
         ]
 
     # --- 2. Query for POIs by Category ---
-    all_pois = {}
-    
-    # Expanded query to include emission sources within 5km radius
-    overpass_query = f"""
-    [out:json][timeout:300];
-    (
-        // 1. Industrial & Manufacturing
-        nwr["industrial"="oil"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["industrial"="gas"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["industrial"="gas_plant"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["industrial"="refinery"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["man_made"="works"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["man_made"="chimney"](around:5000,{geocode_lat},{geocode_lon});
-        
-        // 2. Power Generation
-        nwr["power"="plant"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["plant:source"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["power"="substation"](around:5000,{geocode_lat},{geocode_lon});
-        
-        // 3. Fossil Fuel Extraction & Storage
-        nwr["man_made"="oil_well"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["man_made"="gas_well"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["man_made"="storage_tank"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["landuse"="quarry"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["landuse"="mine"](around:5000,{geocode_lat},{geocode_lon});
-        
-        // 4. Transportation & Vehicle Emissions
-        nwr["aeroway"="aerodrome"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["railway"="yard"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["amenity"="bus_station"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["amenity"="fuel"](around:5000,{geocode_lat},{geocode_lon});
-        
-        // 5. Waste Processing & Landfills
-        nwr["landuse"="landfill"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["man_made"="wastewater_plant"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["man_made"="waste_transfer_station"](around:5000,{geocode_lat},{geocode_lon});
-        nwr["amenity"="recycling"](around:5000,{geocode_lat},{geocode_lon});
-    );
-    out center;
-    """
-    
-    try:
-        response = requests.post(overpass_url, data=overpass_query)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Process and categorize POIs without emission analysis
-        all_pois = {}
-        for element in data.get('elements', []):
-            tags = element.get('tags', {})
-            
-            # Get coordinates
-            if element['type'] == 'node':
-                lat, lon = element.get('lat'), element.get('lon')
-            else:
-                center = element.get('center', {})
-                lat, lon = center.get('lat'), center.get('lon')
-            
-            if lat and lon:
-                # Determine category based on tags for emission sources
-                category = None
-                if 'industrial' in tags:
-                    category = f"industrial_{tags['industrial']}"
-                elif 'landuse' in tags and tags['landuse'] == 'industrial':
-                    category = 'industrial_area'
-                elif 'man_made' in tags and tags['man_made'] in ['works', 'chimney']:
-                    category = f"industrial_{tags['man_made']}"
-                elif 'power' in tags:
-                    category = f"power_{tags['power']}"
-                elif 'plant:source' in tags:
-                    category = f"power_plant_{tags['plant:source']}"
-                elif 'man_made' in tags and tags['man_made'] in ['oil_well', 'gas_well', 'storage_tank']:
-                    category = f"fossil_fuel_{tags['man_made']}"
-                elif 'landuse' in tags and tags['landuse'] in ['quarry', 'mine']:
-                    category = f"extraction_{tags['landuse']}"
-                elif 'aeroway' in tags:
-                    category = f"transport_{tags['aeroway']}"
-                elif 'railway' in tags and tags['railway'] == 'yard':
-                    category = 'transport_railway_yard'
-                # Inside get_pois_overpass function, in the categorization section:
-                elif 'amenity' in tags and tags['amenity'] in ['bus_station', 'parking']:
-                    category = f"transport_{tags['amenity']}"
-                elif 'amenity' in tags and tags['amenity'] == 'fuel':
-                    category = "transport_fuel"  # Specific category for fuel stations
-                elif 'landuse' in tags and tags['landuse'] == 'landfill':
-                    category = 'waste_landfill'
-                elif 'man_made' in tags and tags['man_made'] in ['wastewater_plant', 'waste_transfer_station']:
-                    category = f"waste_{tags['man_made']}"
-                elif 'amenity' in tags and tags['amenity'] == 'recycling':
-                    category = 'waste_recycling'
-                
-                if category:
-                    if category not in all_pois:
-                        all_pois[category] = []
-                    
-                    # Extract detailed information from tags
-                    # Inside the poi_details creation in get_pois_overpass function
-                    poi_details = {
-                    'lat': lat,
-                    'lon': lon,
-                    'type': element['type'],
-                    'id': element.get('id', ''),
-                    'name': tags.get('name', ''),
-                    'display_name': tags.get('name') or f"{category.replace('_', ' ').title()}",  # Add a display_name that's more user-friendly
-                    'address': {
-                    'street': tags.get('addr:street', ''),
-                    'housenumber': tags.get('addr:housenumber', ''),
-                    'city': tags.get('addr:city', ''),
-                    'postcode': tags.get('addr:postcode', '')
-                    },
-                    'operator': tags.get('operator', ''),
-                    'description': tags.get('description', ''),
-                    'tags': tags
-                    }
-                    all_pois[category].append(poi_details)
-    
-    except Exception as e:
-        print(f"Error fetching POIs: {str(e)}")
+    all_pois, search = fetch_emission_sources(geocode_lat, geocode_lon, radius, max_elements)
     
     return {
         "pois": all_pois,
@@ -186,7 +480,8 @@ def get_pois_overpass(area_name, city_name, poi_categories):
             "lon": geocode_lon,
             "display_name": geocode_data[0].get('display_name', '')
         },
-        "bbox": bbox
+        "bbox": bbox,
+        "search": search
     }
 
 
@@ -311,74 +606,90 @@ def create_basic_geojson(bbox, area_name, city_name, pois_data):
 
 
 
+# Number of POIs included in the Gemini pollutant prompt
+LLM_BATCH_SIZE = 20
+
+# Define super categories based on what we collect from the Overpass query
+SUPER_CATEGORIES = {
+    "industrial": {
+        "color": "#FF4136",  # Red
+        "display_name": "Industrial & Manufacturing",
+        "patterns": ["industrial_", "landuse=industrial", "man_made=works", "man_made=chimney"]
+    },
+    "power": {
+        "color": "#FFDC00",  # Yellow
+        "display_name": "Power Generation",
+        "patterns": ["power_"]
+    },
+    "fossil_fuel": {
+        "color": "#0074D9",  # Blue
+        "display_name": "Fossil Fuel Extraction & Storage",
+        "patterns": ["fossil_fuel_", "extraction_"]
+    },
+    "fuel_station": {  # New category specifically for fuel stations
+        "color": "#FB8C00",  # Orange color for fuel stations
+        "display_name": "Fuel Stations",
+        "patterns": ["transport_fuel"]
+    },
+    "transportation": {
+        "color": "#2ECC40",  # Green
+        "display_name": "Transportation & Vehicle Emissions",
+        "patterns": ["transport_"]
+    },
+    "waste": {
+        "color": "#B10DC9",  # Purple
+        "display_name": "Waste Processing & Landfills",
+        "patterns": ["waste_"]
+    },
+    "other": {
+        "color": "#111111",  # Dark Gray
+        "display_name": "Other Emission Sources",
+        "patterns": []  # Catch-all for anything else
+    }
+}
+
+def get_super_category(category, super_categories=SUPER_CATEGORIES):
+    """Return the super-category key whose patterns match the category."""
+    for sc, sc_data in super_categories.items():
+        for pattern in sc_data["patterns"]:
+            if pattern in category.lower():
+                return sc
+    return "other"  # Default
+
+def new_poi_table():
+    """Create an empty PoiTable using this module's category rules."""
+    return PoiTable(super_category_of=get_super_category, default_pollutants_of=get_pollutants_by_category)
+
+def dumps_results(results, **kwargs):
+    """Serialize pipeline results, expanding lazy POI views."""
+    return json.dumps(results, default=json_default, **kwargs)
+
 # Update the emissions data processing in generate_pois_geojson function
 
-def generate_pois_geojson(area_name, city_name, pois_data, bbox):
-    """Generate a GeoJSON with emission source points and boundary."""
+def generate_pois_geojson(area_name, city_name, pois_table, bbox):
+    """Generate a GeoJSON with emission source points and boundary.
+
+    Pollutants returned by Gemini are written back into ``pois_table``; the
+    features themselves are only built when the response is serialized.
+    """
+    super_categories = SUPER_CATEGORIES
     geojson = {
         "type": "FeatureCollection",
-        "features": []
+        "features": LazyView(lambda: list(pois_table.iter_features(super_categories)), "geojson features")
     }
     
-    # Define super categories based on what we collect from the Overpass query
-    super_categories = {
-        "industrial": {
-            "color": "#FF4136",  # Red
-            "display_name": "Industrial & Manufacturing",
-            "patterns": ["industrial_", "landuse=industrial", "man_made=works", "man_made=chimney"]
-        },
-        "power": {
-            "color": "#FFDC00",  # Yellow
-            "display_name": "Power Generation",
-            "patterns": ["power_"]
-        },
-        "fossil_fuel": {
-            "color": "#0074D9",  # Blue
-            "display_name": "Fossil Fuel Extraction & Storage",
-            "patterns": ["fossil_fuel_", "extraction_"]
-        },
-        "fuel_station": {  # New category specifically for fuel stations
-            "color": "#FB8C00",  # Orange color for fuel stations
-            "display_name": "Fuel Stations",
-            "patterns": ["transport_fuel"]
-        },
-        "transportation": {
-            "color": "#2ECC40",  # Green
-            "display_name": "Transportation & Vehicle Emissions",
-            "patterns": ["transport_"]
-        },
-        "waste": {
-            "color": "#B10DC9",  # Purple
-            "display_name": "Waste Processing & Landfills",
-            "patterns": ["waste_"]
-        },
-        "other": {
-            "color": "#111111",  # Dark Gray
-            "display_name": "Other Emission Sources",
-            "patterns": []  # Catch-all for anything else
-        }
-    }
-    
-    # Prepare batch data for Gemini analysis
-    batch_pois = []
-    for category, pois in pois_data.items():
-        for poi in pois:
-            if poi.get('lat') and poi.get('lon'):
-                batch_pois.append({
-                    "category": category,
-                    "name": poi.get('name', 'Unnamed POI'),
-                    "lat": poi['lat'],
-                    "lon": poi['lon'],
-                    "tags": poi.get('tags', {})
-                })
+    # Prepare batch data for Gemini analysis. Only the first LLM_BATCH_SIZE POIs
+    # go into the prompt (the rest use category defaults).
+    batch_pois = pois_table.llm_batch(LLM_BATCH_SIZE)
+    batch_total = len(pois_table)
     
     # Process Gemini response with better error handling
     emissions_data = {}
     try:
         # Single Gemini call for all POIs
         analysis_prompt = f"""
-        Analyze environmental impact for these {len(batch_pois)} points of interest in {area_name}, {city_name}.
-        For each POI in this list: {json.dumps(batch_pois[:min(len(batch_pois), 20)], indent=2)}
+        Analyze environmental impact for these {batch_total} points of interest in {area_name}, {city_name}.
+        For each POI in this list: {json.dumps(batch_pois, indent=2)}
         
         Return a JSON array where each element contains:
         - "lat": Original latitude
@@ -395,7 +706,7 @@ def generate_pois_geojson(area_name, city_name, pois_data, bbox):
         ]
         """
         
-        response = model.generate_content(analysis_prompt)
+        response = llm_scheduler.generate(analysis_prompt, priority=PRIORITY_ENRICHMENT, timeout=LLM_ENRICHMENT_TIMEOUT)
         
         # Print the raw response from Gemini
         
@@ -436,80 +747,33 @@ def generate_pois_geojson(area_name, city_name, pois_data, bbox):
             }
             
         print(f"Successfully analyzed {len(emissions_data)} POIs with Gemini")
+    except LLMQueueTimeout as e:
+        # Under load enrichment is skipped rather than queued indefinitely
+        print(f"Skipping Gemini enrichment: {str(e)}")
     except Exception as e:
         print(f"Gemini analysis error: {str(e)}")
         # Print the full exception traceback for debugging
         import traceback
         traceback.print_exc()
         
-        # Generate fallback data with just pollutant names
-        print("Generating fallback emissions data with pollutant names only")
-        for poi in batch_pois:
-            # Create basic emissions data based on category
-            category = poi["category"]
-            pollutants = get_pollutants_by_category(category)
-            emissions_data[f"{poi['lat']},{poi['lon']}"] = {
-                "lat": poi["lat"],
-                "lon": poi["lon"],
-                "pollutants": pollutants,  # List of pollutant names
-            }
+        # Rows keep their category default pollutants
+        print("Falling back to category pollutant names")
     
-    # Create a dictionary to count POIs by super-category
-    super_category_counts = {category: 0 for category in super_categories}
+    # Attach the Gemini pollutants to the matching rows
+    if emissions_data:
+        rows = pois_table.rows_by_coordinate()
+        for key, emission in emissions_data.items():
+            row = rows.get(key)
+            if row is not None:
+                pois_table.set_pollutants(row, emission["pollutants"])
     
-    # Process each POI with emissions data
-    for category, pois in pois_data.items():
-        for poi in pois:
-            if poi.get('lat') and poi.get('lon'):
-                # Determine super-category
-                super_category = "other"  # Default
-                for sc, sc_data in super_categories.items():
-                    for pattern in sc_data["patterns"]:
-                        if pattern in category.lower():
-                            super_category = sc
-                            break
-                    if super_category != "other":
-                        break
-                
-                # Increment count for this super-category
-                super_category_counts[super_category] += 1
-                
-                # Get emissions data for this POI
-                poi_key = f"{poi['lat']},{poi['lon']}"
-                emission = emissions_data.get(poi_key, {
-                    "pollutants": get_pollutants_by_category(category),
-
-                })
-                
-                # Create properties for this POI
-                properties = {
-                    "type": "poi",
-                    "super_category": super_category,
-                    "display_name": super_categories[super_category]["display_name"],
-                    "category": category,
-                    "name": poi.get('name') or category,
-                    "display_name": poi.get('display_name') or category.replace('_', ' ').title(),  # Use our new display_name
-                    "color": super_categories[super_category]["color"],
-                    "pollutants": emission.get("pollutants", []),
-                    "address": poi.get('address', {}),
-                    "operator": poi.get('operator', ''),
-                    "description": poi.get('description', ''),
-                    "tags": poi.get('tags', {})
-                }
-                
-                # Add this POI to the GeoJSON
-                geojson["features"].append({
-                    "type": "Feature",
-                    "geometry": {
-                        "type": "Point",
-                        "coordinates": [poi['lon'], poi['lat']]
-                    },
-                    "properties": properties
-                })
+    # Count POIs by super-category
+    super_category_counts = pois_table.counts_by_super_category()
     
     # Create pie chart data from super-category counts
     pie_chart_data = []
-    for sc, count in super_category_counts.items():
+    for sc in super_categories:
+        count = super_category_counts.get(sc, 0)
         if count > 0:  # Only include categories with POIs
             pie_chart_data.append({
                 "name": super_categories[sc]["display_name"],
@@ -564,9 +828,10 @@ def get_air_quality(lat, lon):
     url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={api_key}"
     
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        data = shared_cache.cached(
+            "openweather", openweather_cache_key("air_pollution", lat, lon), WEATHER_CACHE_TTL,
+            lambda: fetch_json("openweather", url)
+        )
         
         if 'list' in data and len(data['list']) > 0:
             current_data = data['list'][0]
@@ -609,15 +874,18 @@ def get_weather_data(lat, lon):
     url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&units=metric&appid={api_key}"
     
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        data = shared_cache.cached(
+            "openweather", openweather_cache_key("weather", lat, lon), WEATHER_CACHE_TTL,
+            lambda: fetch_json("openweather", url)
+        )
         
         return {
             'temp': data['main']['temp'],
             'feels_like': data['main']['feels_like'],
             'humidity': data['main']['humidity'],
             'wind_speed': data['wind']['speed'],
+            'wind_deg': data['wind'].get('deg', 0),
+            'clouds': data.get('clouds', {}).get('all'),
             'description': data['weather'][0]['description'],
             'icon': data['weather'][0]['icon'],
             'city': data['name'],
@@ -643,9 +911,11 @@ def reverse_geocode(lat, lon):
     """Get location name from coordinates using Nominatim API"""
     try:
         url = f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lon}&format=json&zoom=10"
-        response = requests.get(url, headers={'User-Agent': 'EnviMap/1.0'})
-        response.raise_for_status()
-        data = response.json()
+        data = shared_cache.cached(
+            "geocode", url, GEOCODE_CACHE_TTL,
+            lambda: fetch_json("nominatim", url, headers={'User-Agent': 'EnviMap/1.0'}),
+            cacheable=lambda data: 'error' not in data
+        )
         
         # Extract address components
         address = data.get('address', {})
@@ -663,10 +933,12 @@ def reverse_geocode(lat, lon):
         }
     except Exception as e:
         print(f"Reverse geocoding error: {str(e)}")
+        # The placeholders keep the pipeline going; "error" lets callers tell them from real names
         return {
             'city': 'Unknown City',
             'area': 'Unknown Area',
-            'display_name': 'Unknown Location'
+            'display_name': 'Unknown Location',
+            'error': f"Reverse geocoding failed: {str(e)}"
         }
 
 def generate_health_recommendations(location, air_quality, weather):
@@ -721,7 +993,7 @@ def generate_health_recommendations(location, air_quality, weather):
     Respond only with the JSON object, no additional text.
     """
 
-    response = model.generate_content(llm_prompt)
+    response = llm_scheduler.generate(llm_prompt, priority=PRIORITY_HEALTH, timeout=LLM_QUEUE_TIMEOUT)
     raw_response = response.text.strip()
         
         # Find the JSON object in the response
@@ -745,6 +1017,24 @@ def generate_health_recommendations(location, air_quality, weather):
 
 @app.post("/analyze-area")
 async def analyze_area(area_request: dict):
+    # The pipeline is blocking I/O, so run it off the event loop
+    results = await run_in_threadpool(run_analysis, area_request)
+    # Serialize directly; FastAPI's generic encoder is slow on large feature lists
+    return Response(content=dumps_results(results), media_type="application/json")
+
+def run_analysis(area_request):
+    """Run the full area analysis pipeline and return the final results dict.
+
+    Raises HTTPException on failure. Shared by the /analyze-area route and the
+    background job workers.
+    """
+    # Optional search parameters: "radius" (metres or "auto") and "max_elements"
+    try:
+        radius = parse_search_radius(area_request.get('radius'))
+        max_elements = parse_max_elements(area_request.get('max_elements'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # Get coordinates from request
     latitude = area_request.get('latitude')
     longitude = area_request.get('longitude')
@@ -771,27 +1061,27 @@ async def analyze_area(area_request: dict):
     try:
         # Get POIs from Overpass API
         print("\n[1/3] Getting POIs from Overpass...")
-        overpass_pois_data = get_pois_overpass(area_name, city_name, poi_categories)
+        overpass_pois_data = get_pois_overpass(area_name, city_name, poi_categories, radius, max_elements)
 
         if "error" in overpass_pois_data:
             print(f"Error fetching POIs from Overpass: {overpass_pois_data['error']}")
             raise HTTPException(status_code=500, detail=overpass_pois_data['error'])
 
-        categorized_pois = overpass_pois_data['pois']
+        pois_table = overpass_pois_data['pois']
         geocode = overpass_pois_data['geocode']
         bbox = overpass_pois_data.get('bbox')
         
-        print(f"Total POIs after combining: {sum(len(pois) for pois in categorized_pois.values())}")
+        print(f"Total POIs after combining: {len(pois_table)}")
         
         # Generate GeoJSON with POIs and boundary
         print("\n[3/3] Generating POIs GeoJSON...")
-        pois_geojson, super_categories, pie_chart_data = generate_pois_geojson(area_name, city_name, categorized_pois, bbox)
+        pois_geojson, super_categories, pie_chart_data = generate_pois_geojson(area_name, city_name, pois_table, bbox)
         
         # Updated analysis prompt for emission sources analysis for EHSO
         analysis_prompt = f"""
         imagine you are an environmental health expert.
         Analyze the environmental impact for {area_name}, {city_name} and provide a structured assessment.
-        Based on the POIs: {json.dumps(categorized_pois, indent=2)}
+        Based on the POIs: {json.dumps(pois_table.categorized(), indent=2)}
 
         Return a JSON with:
         - "category": One word status (Good/Moderate/Poor/Severe/Critical)
@@ -811,7 +1101,7 @@ async def analyze_area(area_request: dict):
 
         # Get analysis
         try:
-            response = model.generate_content(analysis_prompt)
+            response = llm_scheduler.generate(analysis_prompt, priority=PRIORITY_SUMMARY, timeout=LLM_QUEUE_TIMEOUT)
             
             # Extract JSON from the response
             json_start = response.text.find('{')
@@ -836,8 +1126,9 @@ async def analyze_area(area_request: dict):
                 "ai_rating": analysis_results.get("ai_rating", 0),
                 "geocode": geocode,
                 "bbox": bbox,
+                "search": overpass_pois_data.get('search'),
                 "geojson": pois_geojson,
-                "pois": categorized_pois,
+                "pois": LazyView(pois_table.categorized, "pois by category"),
                 "air_quality": {
                     **air_quality_data,
                     "location": {
@@ -865,16 +1156,235 @@ async def analyze_area(area_request: dict):
             print("Final Results:", final_results)  # Log the final results
             return final_results
             
+        except LLMQueueTimeout as e:
+            print(f"LLM overloaded: {str(e)}")
+            raise HTTPException(status_code=503, detail=f"LLM busy, try again later: {str(e)}")
         except Exception as e:
             print(f"LLM API Error: {str(e)}")
             raise HTTPException(status_code=502, detail=f"LLM API Error: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Unexpected Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+# --- Tiled POIs ---
+# Emission sources are also served per map tile, so a panning client only
+# re-downloads tiles whose ETag changed, or just the features that changed.
+
+def fetch_tile_features(south, west, north, east):
+    """Fetch the emission-source features in a bounding box (pollutants are category defaults)."""
+    query = build_emission_bbox_query(south, west, north, east)
+    trailer = {}
+    with upstream_slot("overpass"):
+        with requests.post(OVERPASS_URL, data=query, stream=True) as response:
+            response.raise_for_status()
+            table = build_poi_table(iter_response_elements(response, trailer=trailer))
+    if trailer.get('remark'):
+        # A partial tile must not be stored as the tile's current version
+        raise ValueError(f"Overpass remark: {trailer['remark']}")
+    # Ways crossing the box edge are returned even if their center is outside;
+    # the tile store assigns each feature to the tile containing its point
+    return list(table.iter_features(SUPER_CATEGORIES))
+
+tile_store = TileStore(fetch_tile_features, ttl=int(os.getenv("TILE_TTL_SECONDS", "900")), shared_cache=shared_cache)
+
+@app.get("/pois/tiles/{z}/{x}/{y}")
+def get_poi_tile(z: int, x: int, y: int, if_none_match: str = Header(None)):
+    """One tile of emission sources as a FeatureCollection, with ETag / If-None-Match support."""
+    if z != TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail=f"Tiles are served at zoom {TILE_ZOOM} only")
+    try:
+        version = tile_store.get(x, y)
+    except Exception as e:
+        print(f"Error fetching tile {z}/{x}/{y}: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Overpass error: {str(e)}")
+    headers = {"ETag": version.etag, "Cache-Control": f"max-age={tile_store.ttl}"}
+    if etag_matches(if_none_match, version.etag):
+        return Response(status_code=304, headers=headers)
+    content = json.dumps({"type": "FeatureCollection", "features": version.features})
+    return Response(content=content, media_type="application/geo+json", headers=headers)
+
+@app.post("/pois/delta")
+def get_poi_delta(delta_request: dict):
+    """Tile-by-tile changes for the circle around a point.
+
+    Request: {"latitude", "longitude", "radius", "have": {"z/x/y": etag, ...}}.
+    Each tile in view comes back as "unchanged", a "delta" (added/removed
+    features against the held version) or "full". Held tiles that are out of
+    view are listed under "drop".
+    """
+    try:
+        lat = float(delta_request['latitude'])
+        lon = float(delta_request['longitude'])
+        radius = parse_search_radius(delta_request.get('radius'))
+        if radius == "auto":
+            radius = MAX_SEARCH_RADIUS
+        have = delta_request.get('have') or {}
+        if not isinstance(have, dict):
+            raise ValueError("'have' must be an object of tile key to ETag")
+        for key, etag in have.items():
+            parse_tile_key(key)
+            if not isinstance(etag, str):
+                raise ValueError(f"ETag for tile {key} must be a string")
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid delta request: {str(e)}")
+
+    in_view = tiles_covering(lat, lon, radius)
+    try:
+        tiles = tile_store.delta(in_view, have)
+    except Exception as e:
+        print(f"Error building POI delta: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Overpass error: {str(e)}")
+    visible = {tile_key(x, y) for x, y in in_view}
+    return Response(
+        content=json.dumps({
+            "zoom": TILE_ZOOM,
+            "tiles": tiles,
+            "drop": sorted(key for key in have if key not in visible)
+        }),
+        media_type="application/json"
+    )
+
+# --- Dispersion ---
+DISPERSION_GRID_SIZE = int(os.getenv("DISPERSION_GRID_SIZE", "200"))
+MAX_DISPERSION_GRID_SIZE = 500
+
+@app.post("/dispersion")
+def dispersion_layer(dispersion_request: dict):
+    """Gaussian-plume concentration raster for the emission sources around a point.
+
+    Request: {"latitude", "longitude", "radius"?, "max_elements"?, "grid_size"?,
+    "stability"?}. Wind speed and direction come from OpenWeather; the
+    stability class is derived from wind, day/night and cloud cover unless given.
+    """
+    # NumPy is only needed here, so keep it out of the worker's import path
+    from dispersion import STABILITY_CLASSES, concentration_field, encode_raster, grid_bounds, \
+        sources_from_categories, stability_class
+
+    try:
+        lat = float(dispersion_request['latitude'])
+        lon = float(dispersion_request['longitude'])
+        radius = parse_search_radius(dispersion_request.get('radius'))
+        max_elements = parse_max_elements(dispersion_request.get('max_elements'))
+        grid_size = int(dispersion_request.get('grid_size') or DISPERSION_GRID_SIZE)
+        stability = dispersion_request.get('stability')
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid dispersion request: {str(e)}")
+    if not 10 <= grid_size <= MAX_DISPERSION_GRID_SIZE:
+        raise HTTPException(status_code=400, detail=f"grid_size must be between 10 and {MAX_DISPERSION_GRID_SIZE}")
+    if stability is not None and stability not in STABILITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"stability must be one of {', '.join(STABILITY_CLASSES)}")
+
+    weather = get_weather_data(lat, lon)
+    if 'error' in weather:
+        raise HTTPException(status_code=502, detail=weather['error'])
+    table, search = fetch_emission_sources(lat, lon, radius, max_elements)
+    if search['error']:
+        # An empty raster would look like a clean area
+        raise HTTPException(status_code=502, detail=search['error'])
+
+    is_daytime = not str(weather.get('icon', '')).endswith('n')
+    if stability is None:
+        stability = stability_class(weather['wind_speed'], is_daytime, weather.get('clouds'))
+
+    src_lat, src_lon, q, h = sources_from_categories(
+        table.lat, table.lon, [table.super_category(row) for row in range(len(table))]
+    )
+    field = concentration_field(
+        src_lat, src_lon, q, h, lat, lon, search['radius'], grid_size,
+        wind_speed=weather['wind_speed'], wind_direction=weather['wind_deg'], stability=stability
+    )
+    return {
+        "raster": encode_raster(field, grid_bounds(lat, lon, search['radius'])),
+        "wind": {"speed": weather['wind_speed'], "direction": weather['wind_deg']},
+        "stability": stability,
+        "sources": len(table),
+        "search": search
+    }
+
+# --- Background jobs ---
+# Long analyses can outlive proxy timeouts, so /jobs/analyze-area returns a job
+# id immediately and the result is fetched by polling or via an event stream.
+job_queue = JobQueue(
+    db_path=os.getenv("JOBS_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db")),
+    runner=run_analysis,
+    serializer=dumps_results,
+    max_workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_pending=int(os.getenv("JOB_MAX_PENDING", "100")),
+    # Finished jobs keep their full result, so they are deleted after this many seconds
+    result_ttl=int(os.getenv("JOB_RESULT_TTL", "86400")),
+)
+
+@app.on_event("startup")
+async def start_job_queue():
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    job_queue.shutdown()
+
+@app.post("/jobs/analyze-area", status_code=202)
+async def submit_analysis_job(area_request: dict):
+    try:
+        job_id = job_queue.submit(area_request)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def subscribe_analysis_job(job_id: str):
+    """Server-sent events: one event per status change, the last one carries the result."""
+    job = await run_in_threadpool(job_queue.get, job_id, False)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        # Waiting happens on the event loop; a threadpool thread is only used
+        # briefly to read the job when its status has changed
+        status = None
+        while True:
+            current_status = await job_queue.wait_for_change(job_id, status, 15.0)
+            if current_status is None:
+                return
+            if current_status == status:
+                # Keep the connection alive through proxies while the job runs
+                yield ": keep-alive\n\n"
+                continue
+            current = await run_in_threadpool(job_queue.get, job_id)
+            if current is None:
+                return
+            status = current["status"]
+            yield f"event: {status}\ndata: {json.dumps(current)}\n\n"
+            if status in FINISHED_STATES:
+                return
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    parser = argparse.ArgumentParser(description="Run the API server.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="Worker processes; they share the job database and the upstream cache")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Multiple workers need an import string so each process loads the app itself
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
     
 '''HERE CHECKPOINT WORKING
 
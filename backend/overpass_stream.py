@@ -0,0 +1,125 @@
+"""Incremental parser for Overpass API JSON responses.
+
+Overpass returns one JSON object with a large "elements" array. Decoding it
+with response.json() holds the raw body and every parsed element in memory at
+once. iter_elements() reads the body chunk by chunk instead and yields
+elements one at a time, so only the current element and a small read buffer
+are alive at any point.
+"""
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class OverpassStreamError(ValueError):
+    """Raised when the response body is not a valid Overpass JSON document."""
+
+
+def iter_elements(chunks, trailer=None):
+    """Yield each item of the top-level "elements" array from an iterable of byte chunks.
+
+    Keys before the array (version, osm3s, ...) are skipped. If ``trailer`` is
+    a dict, the keys after the array are stored in it once the array has been
+    consumed. Overpass reports timeouts and out-of-memory errors there, as a
+    "remark" next to an empty or partial array, with HTTP status 200.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    exhausted = False
+
+    def fill():
+        # Append the next chunk to the buffer, dropping what was already consumed
+        nonlocal buf, pos, exhausted
+        if exhausted:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buf = buf[pos:] + text_decoder.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        return True
+
+    # --- 1. Find the start of the elements array ---
+    key = '"elements"'
+    while True:
+        idx = buf.find(key, pos)
+        if idx == -1:
+            # Keep a tail in case the key is split across chunks
+            pos = max(pos, len(buf) - len(key))
+            if not fill():
+                raise OverpassStreamError("No elements array in response")
+            continue
+        pos = idx + len(key)
+        # Only a key followed by ':' counts; the same text can appear inside a string value
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf):
+                break
+            if not fill():
+                raise OverpassStreamError("Truncated response before elements array")
+        if buf[pos] == ":":
+            pos += 1
+            break
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos < len(buf):
+            break
+        if not fill():
+            raise OverpassStreamError("Truncated response before elements array")
+    if buf[pos] != "[":
+        raise OverpassStreamError("Expected '[' after \"elements\"")
+    pos += 1
+
+    # --- 2. Decode one element at a time ---
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE + ",":
+            pos += 1
+        if pos >= len(buf):
+            if not fill():
+                raise OverpassStreamError("Truncated response inside elements array")
+            continue
+        if buf[pos] == "]":
+            if trailer is not None:
+                pos += 1
+                while fill():
+                    pass
+                trailer.update(_parse_trailer(buf[pos:]))
+            return
+        try:
+            element, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Element is split across chunks; read more and retry
+            if not fill():
+                raise OverpassStreamError("Truncated element in response")
+            continue
+        pos = end
+        yield element
+
+
+def _parse_trailer(text):
+    """Parse the rest of the top-level object after the elements array, e.g. ', "remark": "..."}'."""
+    text = text.strip()
+    if text == "}":
+        return {}
+    if not text.startswith(","):
+        raise OverpassStreamError("Expected ',' or '}' after elements array")
+    try:
+        trailer = json.loads("{" + text[1:])
+    except json.JSONDecodeError:
+        raise OverpassStreamError("Truncated response after elements array")
+    if not isinstance(trailer, dict):
+        raise OverpassStreamError("Malformed response after elements array")
+    return trailer
+
+
+def iter_response_elements(response, chunk_size=64 * 1024, trailer=None):
+    """Yield Overpass elements from a streamed requests.Response (see iter_elements for ``trailer``)."""
+    return iter_elements(response.iter_content(chunk_size=chunk_size), trailer)
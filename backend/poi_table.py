@@ -0,0 +1,273 @@
+"""Compact per-request container for emission-source POIs.
+
+Every pipeline stage used to build its own nested dict per POI (the Overpass
+record, the LLM batch entry, the GeoJSON properties and the copy returned
+under "pois"). PoiTable stores each POI once as a row across typed arrays:
+coordinates and OSM ids in ``array`` buffers, categories, super-categories and
+pollutant lists as interned integer codes, and the OSM tag dict by reference.
+The dict shapes the API returns are produced on demand by the view methods,
+typically only while the response is being serialized.
+"""
+import base64
+from array import array
+
+ELEMENT_TYPES = ("node", "way", "relation")
+_ELEMENT_TYPE_CODES = {name: code for code, name in enumerate(ELEMENT_TYPES)}
+
+
+class PoiTable:
+    """Struct-of-arrays table of POIs.
+
+    ``super_category_of`` maps a category string to its super-category key;
+    it runs once per distinct category, not once per POI.
+    ``default_pollutants_of`` gives the fallback pollutant list for a category.
+    """
+
+    def __init__(self, super_category_of, default_pollutants_of):
+        self._super_category_of = super_category_of
+        self._default_pollutants_of = default_pollutants_of
+
+        self.lat = array("d")
+        self.lon = array("d")
+        self.osm_id = array("q")
+        self.element_type = array("B")
+        self.category_code = array("H")
+        self.super_category_code = array("B")
+        self.pollutants_code = array("H")
+        self.tags = []
+
+        # Interned values, indexed by the codes above
+        self.categories = []
+        self.super_categories = []
+        self.pollutant_sets = []
+        self._category_index = {}
+        self._super_category_index = {}
+        self._pollutants_index = {}
+        self._category_super_code = []
+        self._category_pollutants_code = []
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __repr__(self):
+        return f"<PoiTable {len(self)} POIs in {len(self.categories)} categories>"
+
+    # --- Interning ---
+
+    def _intern_category(self, category):
+        code = self._category_index.get(category)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self._category_index[category] = code
+            self._category_super_code.append(self._intern_super_category(self._super_category_of(category)))
+            self._category_pollutants_code.append(self._intern_pollutants(self._default_pollutants_of(category)))
+        return code
+
+    def _intern_super_category(self, super_category):
+        code = self._super_category_index.get(super_category)
+        if code is None:
+            code = len(self.super_categories)
+            self.super_categories.append(super_category)
+            self._super_category_index[super_category] = code
+        return code
+
+    def _intern_pollutants(self, pollutants):
+        key = tuple(pollutants)
+        try:
+            code = self._pollutants_index.get(key)
+        except TypeError:
+            # Unhashable items (the LLM sometimes returns objects); store without interning
+            self.pollutant_sets.append(list(pollutants))
+            return len(self.pollutant_sets) - 1
+        if code is None:
+            code = len(self.pollutant_sets)
+            self.pollutant_sets.append(list(key))
+            self._pollutants_index[key] = code
+        return code
+
+    # --- Building ---
+
+    def append(self, category, element_type, osm_id, lat, lon, tags):
+        """Add one POI and return its row index."""
+        code = self._intern_category(category)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.osm_id.append(osm_id or 0)
+        self.element_type.append(_ELEMENT_TYPE_CODES.get(element_type, 0))
+        self.category_code.append(code)
+        self.super_category_code.append(self._category_super_code[code])
+        self.pollutants_code.append(self._category_pollutants_code[code])
+        self.tags.append(tags)
+        return len(self.lat) - 1
+
+    def set_pollutants(self, row, pollutants):
+        self.pollutants_code[row] = self._intern_pollutants(pollutants)
+
+    # --- Compact serialization (for the shared cache) ---
+
+    def to_columns(self):
+        """JSON-friendly form of the rows: the typed arrays as base64 plus the tag list.
+
+        Pollutant overrides are not included; rows reload with category defaults.
+        """
+        return {
+            "categories": self.categories,
+            "category_code": _pack(self.category_code),
+            "element_type": _pack(self.element_type),
+            "osm_id": _pack(self.osm_id),
+            "lat": _pack(self.lat),
+            "lon": _pack(self.lon),
+            "tags": self.tags,
+        }
+
+    def load_columns(self, columns):
+        """Append the rows of a to_columns() dict."""
+        categories = columns["categories"]
+        category_code = _unpack("H", columns["category_code"])
+        element_type = _unpack("B", columns["element_type"])
+        osm_id = _unpack("q", columns["osm_id"])
+        lat = _unpack("d", columns["lat"])
+        lon = _unpack("d", columns["lon"])
+        for row, tags in enumerate(columns["tags"]):
+            self.append(categories[category_code[row]], ELEMENT_TYPES[element_type[row]], osm_id[row],
+                        lat[row], lon[row], tags)
+
+    # --- Row accessors ---
+
+    def category(self, row):
+        return self.categories[self.category_code[row]]
+
+    def super_category(self, row):
+        return self.super_categories[self.super_category_code[row]]
+
+    def pollutants(self, row):
+        return self.pollutant_sets[self.pollutants_code[row]]
+
+    def feature_id(self, row):
+        """Stable identifier such as "node/123"."""
+        return f"{ELEMENT_TYPES[self.element_type[row]]}/{self.osm_id[row]}"
+
+    def counts_by_super_category(self):
+        counts = [0] * len(self.super_categories)
+        for code in self.super_category_code:
+            counts[code] += 1
+        return dict(zip(self.super_categories, counts))
+
+    def rows_by_coordinate(self):
+        """Map "lat,lon" keys (the format the LLM echoes back) to row indices."""
+        return {f"{lat},{lon}": row for row, (lat, lon) in enumerate(zip(self.lat, self.lon))}
+
+    # --- Views ---
+
+    def poi_record(self, row):
+        """The per-POI dict shape returned under "pois" by /analyze-area."""
+        tags = self.tags[row]
+        category = self.category(row)
+        return {
+            'lat': self.lat[row],
+            'lon': self.lon[row],
+            'type': ELEMENT_TYPES[self.element_type[row]],
+            'id': self.osm_id[row],
+            'name': tags.get('name', ''),
+            'display_name': tags.get('name') or category.replace('_', ' ').title(),
+            'address': {
+                'street': tags.get('addr:street', ''),
+                'housenumber': tags.get('addr:housenumber', ''),
+                'city': tags.get('addr:city', ''),
+                'postcode': tags.get('addr:postcode', '')
+            },
+            'operator': tags.get('operator', ''),
+            'description': tags.get('description', ''),
+            'tags': tags
+        }
+
+    def categorized(self):
+        """Build the {category: [poi_record, ...]} mapping."""
+        result = {}
+        for row in range(len(self)):
+            result.setdefault(self.category(row), []).append(self.poi_record(row))
+        return result
+
+    def llm_batch(self, limit):
+        """The first ``limit`` POIs in the compact shape sent to Gemini."""
+        return [
+            {
+                "category": self.category(row),
+                "name": self.tags[row].get('name', ''),
+                "lat": self.lat[row],
+                "lon": self.lon[row],
+                "tags": self.tags[row]
+            }
+            for row in range(min(limit, len(self)))
+        ]
+
+    def feature(self, row, super_categories):
+        """GeoJSON Point feature for one row."""
+        tags = self.tags[row]
+        category = self.category(row)
+        super_category = self.super_category(row)
+        return {
+            "type": "Feature",
+            "id": self.feature_id(row),
+            "geometry": {
+                "type": "Point",
+                "coordinates": [self.lon[row], self.lat[row]]
+            },
+            "properties": {
+                "type": "poi",
+                "super_category": super_category,
+                "category": category,
+                "name": tags.get('name') or category,
+                "display_name": tags.get('name') or category.replace('_', ' ').title(),
+                "color": super_categories[super_category]["color"],
+                "pollutants": self.pollutants(row),
+                "address": {
+                    'street': tags.get('addr:street', ''),
+                    'housenumber': tags.get('addr:housenumber', ''),
+                    'city': tags.get('addr:city', ''),
+                    'postcode': tags.get('addr:postcode', '')
+                },
+                "operator": tags.get('operator', ''),
+                "description": tags.get('description', ''),
+                "tags": tags
+            }
+        }
+
+    def iter_features(self, super_categories, rows=None):
+        for row in (range(len(self)) if rows is None else rows):
+            yield self.feature(row, super_categories)
+
+
+def _pack(values):
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def _unpack(typecode, data):
+    values = array(typecode)
+    values.frombytes(base64.b64decode(data))
+    return values
+
+
+class LazyView:
+    """Placeholder for a list or dict that is only built when serialized.
+
+    Pass ``json_default`` as the ``default`` hook of json.dumps to expand it.
+    """
+
+    def __init__(self, build, description=""):
+        self._build = build
+        self._description = description
+
+    def __repr__(self):
+        return f"<LazyView {self._description}>"
+
+    def materialize(self):
+        return self._build()
+
+
+def json_default(obj):
+    """json.dumps default hook that expands LazyView objects."""
+    if isinstance(obj, LazyView):
+        return obj.materialize()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
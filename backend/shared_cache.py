@@ -0,0 +1,381 @@
+"""Cross-process result cache backed by SQLite in WAL mode.
+
+Every uvicorn worker (and the batch CLI) opens the same database file, so a
+geocode, Overpass result, OpenWeather reading or LLM response fetched by one
+process is reused by all the others. WAL mode lets readers proceed while one
+writer commits, which suits this read-mostly workload.
+
+The cache is best-effort: a database error (a lock held past the busy
+timeout, a full disk) is logged and treated as a miss or a skipped write.
+
+Hit and miss counters are kept per process and per namespace, and are
+written to a stats table at most every ``stats_flush_interval`` seconds, so
+that /metrics/cache can report hit rates for every worker.
+
+The same database also holds upstream rate-limit state shared by all
+processes: token buckets (SharedTokenBucket) and concurrency slots
+(SharedSemaphore), so limits hold for the whole server rather than per worker.
+"""
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+_MISS = object()
+
+
+class SharedCache:
+    def __init__(self, path, enabled=True, stats_flush_interval=1.0, purge_every=1000):
+        self.path = path
+        self.enabled = enabled
+        self.stats_flush_interval = stats_flush_interval
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._last_flush = 0.0
+        self._sets_since_purge = 0
+        if enabled:
+            self._init_db()
+
+    def _connect(self):
+        # sqlite3 connections must not be shared across threads or forked processes
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                worker_pid INTEGER NOT NULL,
+                namespace TEXT NOT NULL,
+                hits INTEGER NOT NULL,
+                misses INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (worker_pid, namespace)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS upstream_slots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                owner_pid INTEGER NOT NULL
+            )
+            """
+        )
+        # Slots recorded under our pid were left by an earlier process with the same pid
+        conn.execute("DELETE FROM upstream_slots WHERE owner_pid = ?", (os.getpid(),))
+
+    def transaction(self):
+        """Context manager running its block in a BEGIN IMMEDIATE transaction; yields the connection."""
+        return _Transaction(self._connect())
+
+    @staticmethod
+    def _hash_key(key):
+        if not isinstance(key, str):
+            key = json.dumps(key, sort_keys=True)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    # --- Values ---
+
+    def get(self, namespace, key, default=None):
+        """Return the cached value, or ``default`` if missing, expired or unreadable."""
+        if not self.enabled:
+            return default
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, self._hash_key(key)),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed ({namespace}): {str(e)}")
+            row = None
+        hit = row is not None and row[1] > time.time()
+        self._count(namespace, hit)
+        return json.loads(row[0]) if hit else default
+
+    def set(self, namespace, key, value, ttl):
+        """Store ``value``; the write is skipped if the database is unavailable."""
+        if not self.enabled:
+            return
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, self._hash_key(key), json.dumps(value), time.time() + ttl),
+            )
+        except sqlite3.Error as e:
+            print(f"Shared cache write skipped ({namespace}): {str(e)}")
+            return
+        with self._lock:
+            self._sets_since_purge += 1
+            purge = self._sets_since_purge >= self.purge_every
+            if purge:
+                self._sets_since_purge = 0
+        if purge:
+            try:
+                self.purge_expired()
+            except sqlite3.Error as e:
+                print(f"Shared cache purge failed: {str(e)}")
+
+    def cached(self, namespace, key, ttl, compute, cacheable=lambda value: True):
+        """Return the cached value for ``key``, computing and storing it on a miss.
+
+        Values for which ``cacheable(value)`` is false (e.g. error results) are
+        returned but not stored.
+        """
+        value = self.get(namespace, key, _MISS)
+        if value is not _MISS:
+            return value
+        value = compute()
+        if cacheable(value):
+            self.set(namespace, key, value, ttl)
+        return value
+
+    def purge_expired(self):
+        if self.enabled:
+            self._connect().execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    # --- Hit-rate statistics ---
+
+    def _count(self, namespace, hit):
+        with self._lock:
+            counters = self._counters.setdefault(namespace, [0, 0])
+            counters[0 if hit else 1] += 1
+            flush = time.monotonic() - self._last_flush >= self.stats_flush_interval
+            if flush:
+                self._last_flush = time.monotonic()
+        if flush:
+            try:
+                self.flush_stats()
+            except sqlite3.Error as e:
+                # Counters stay in memory and go out with the next flush
+                print(f"Shared cache stats flush failed: {str(e)}")
+
+    def local_stats(self):
+        """This process's {namespace: {"hits", "misses", "hit_rate"}}."""
+        with self._lock:
+            return {ns: _rate(hits, misses) for ns, (hits, misses) in self._counters.items()}
+
+    def flush_stats(self):
+        """Write this process's counters to the shared stats table."""
+        if not self.enabled:
+            return
+        with self._lock:
+            snapshot = {ns: tuple(counts) for ns, counts in self._counters.items()}
+        now = time.time()
+        self._connect().executemany(
+            "INSERT OR REPLACE INTO cache_stats (worker_pid, namespace, hits, misses, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(os.getpid(), ns, hits, misses, now) for ns, (hits, misses) in snapshot.items()],
+        )
+
+    def reset_worker_stats(self):
+        """Drop stats rows left by an earlier process with this pid."""
+        if self.enabled:
+            self._connect().execute("DELETE FROM cache_stats WHERE worker_pid = ?", (os.getpid(),))
+
+    def clear_stats(self):
+        """Drop the stats rows of every worker."""
+        if self.enabled:
+            self._connect().execute("DELETE FROM cache_stats")
+
+    def all_stats(self, max_age=3600):
+        """Hit rates per worker and namespace, for workers active in the last ``max_age`` seconds."""
+        if not self.enabled:
+            return {"enabled": False, "workers": {}}
+        self.flush_stats()
+        rows = self._connect().execute(
+            "SELECT worker_pid, namespace, hits, misses FROM cache_stats WHERE updated_at > ? "
+            "ORDER BY worker_pid, namespace",
+            (time.time() - max_age,),
+        ).fetchall()
+        workers = {}
+        totals = {}
+        for pid, namespace, hits, misses in rows:
+            workers.setdefault(str(pid), {})[namespace] = _rate(hits, misses)
+            total = totals.setdefault(namespace, [0, 0])
+            total[0] += hits
+            total[1] += misses
+        return {
+            "enabled": True,
+            "workers": workers,
+            "total": {ns: _rate(hits, misses) for ns, (hits, misses) in totals.items()},
+        }
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        # IMMEDIATE takes the write lock up front, so read-modify-write is atomic across processes
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class SharedTokenBucket:
+    """Token bucket whose state lives in the shared database.
+
+    Drop-in for llm_scheduler.TokenBucket as used by LLMScheduler (try_take
+    and adjust). ``rate_per_minute`` tokens refill continuously up to ``capacity``.
+    """
+
+    def __init__(self, cache, name, rate_per_minute, capacity=None):
+        self.cache = cache
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+
+    def _update(self, change):
+        """Refill, apply ``change(tokens) -> (tokens, result)`` and store the result atomically."""
+        with self.cache.transaction() as conn:
+            row = conn.execute("SELECT tokens, updated FROM rate_buckets WHERE name = ?", (self.name,)).fetchone()
+            now = time.time()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+            tokens, result = change(tokens)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (self.name, tokens, now),
+            )
+        return result
+
+    def try_take(self, amount):
+        """Take ``amount`` tokens if available and return 0, else return seconds to wait."""
+        needed = min(amount, self.capacity)
+
+        def change(tokens):
+            if tokens >= needed:
+                return tokens - amount, 0.0
+            return tokens, (needed - tokens) / self.rate
+
+        return self._update(change)
+
+    def adjust(self, delta):
+        self._update(lambda tokens: (min(self.capacity, tokens - delta), None))
+
+
+class SharedSemaphore:
+    """Counting semaphore across processes, used as a context manager.
+
+    Each held slot is a row tagged with the holder's pid. Slots of processes
+    that died are reclaimed, so a crashed worker cannot leak them. Each try
+    takes the database write lock, so waiters back off: they retry after
+    ``poll_interval`` seconds, doubling up to ``max_poll_interval``, or as soon
+    as a slot is released in this process.
+    """
+
+    def __init__(self, cache, name, limit, poll_interval=0.05, max_poll_interval=1.0):
+        self.cache = cache
+        self.name = name
+        self.limit = limit
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._held = threading.local()
+        self._released = threading.Condition()
+
+    def _try_acquire(self):
+        with self.cache.transaction() as conn:
+            rows = conn.execute("SELECT id, owner_pid FROM upstream_slots WHERE name = ?", (self.name,)).fetchall()
+            dead = [slot_id for slot_id, pid in rows if not process_alive(pid)]
+            if dead:
+                conn.executemany("DELETE FROM upstream_slots WHERE id = ?", [(slot_id,) for slot_id in dead])
+            if len(rows) - len(dead) >= self.limit:
+                return None
+            return conn.execute(
+                "INSERT INTO upstream_slots (name, owner_pid) VALUES (?, ?)", (self.name, os.getpid())
+            ).lastrowid
+
+    def acquire(self, blocking=True, timeout=None):
+        """Take a slot; like threading.Semaphore.acquire, returns False if none was free in time."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = self.poll_interval
+        while True:
+            slot_id = self._try_acquire()
+            if slot_id is not None:
+                if not hasattr(self._held, "slots"):
+                    self._held.slots = []
+                self._held.slots.append(slot_id)
+                return True
+            if not blocking:
+                return False
+            # Jittered, so waiters in different processes do not retry in lockstep
+            wait = random.uniform(interval / 2, interval)
+            interval = min(interval * 2, self.max_poll_interval)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            with self._released:
+                self._released.wait(wait)
+
+    def release(self):
+        slot_id = self._held.slots.pop()
+        with self.cache.transaction() as conn:
+            conn.execute("DELETE FROM upstream_slots WHERE id = ?", (slot_id,))
+        with self._released:
+            self._released.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def process_alive(pid, count_self=True):
+    """Whether a process with this pid is running on this host.
+
+    With ``count_self=False`` our own pid counts as not running, for records
+    that may have been left by an earlier process that had the same pid.
+    """
+    if pid is None or (not count_self and pid == os.getpid()):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _rate(hits, misses):
+    lookups = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": round(hits / lookups, 3) if lookups else None}
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from overpass_stream import OverpassStreamError, iter_elements
+
+DOCUMENT = json.dumps({
+    "version": 0.6,
+    "generator": "Overpass API",
+    "osm3s": {"copyright": "The data included in this document is from www.openstreetmap.org."},
+    "elements": [
+        {"type": "node", "id": 1, "lat": 19.05, "lon": 72.84,
+         "tags": {"name": "Usine \"elements\": [1]", "industrial": "factory"}},
+        {"type": "way", "id": 2, "center": {"lat": 19.06, "lon": 72.85},
+         "tags": {"name": "Centrale électrique — 發電廠 🏭", "power": "plant"}},
+        {"type": "node", "id": 3, "lat": -1.5e-3, "lon": 0, "tags": {}},
+    ],
+    "remark": "trailing \"elements\" text",
+}, ensure_ascii=False, indent=1).encode("utf-8")
+
+EXPECTED = json.loads(DOCUMENT)["elements"]
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, 64, 1024, len(DOCUMENT)])
+def test_matches_json_loads_at_any_chunk_size(size):
+    assert list(iter_elements(chunked(DOCUMENT, size))) == EXPECTED
+
+
+def test_multibyte_characters_split_across_chunks():
+    start = DOCUMENT.index("發".encode("utf-8"))
+    chunks = [DOCUMENT[:start + 1], DOCUMENT[start + 1:start + 2], DOCUMENT[start + 2:]]
+    assert list(iter_elements(chunks)) == EXPECTED
+
+
+def test_elements_string_value_before_array():
+    document = json.dumps({"generator": "elements", "note": ["elements"], "elements": [{"id": 1}]}).encode()
+    assert list(iter_elements(chunked(document, 4))) == [{"id": 1}]
+
+
+def test_empty_array():
+    assert list(iter_elements([b'{"elements": []}'])) == []
+
+
+def test_missing_elements_key_raises():
+    with pytest.raises(OverpassStreamError):
+        list(iter_elements([b'{"version": 0.6, "remark": "runtime error"}']))
+
+
+@pytest.mark.parametrize("cut", [
+    DOCUMENT.index(b'"elements"') + 5,   # inside the key
+    DOCUMENT.index(b'"elements"') + 11,  # after the colon
+    DOCUMENT.index(b'"type": "way"'),    # between elements
+    DOCUMENT.index(b'"power"'),          # inside an element
+])
+def test_truncated_body_raises(cut):
+    with pytest.raises(OverpassStreamError):
+        list(iter_elements(chunked(DOCUMENT[:cut], 8)))
+
+
+@pytest.mark.parametrize("size", [1, 7, len(DOCUMENT)])
+def test_trailer_reports_remark(size):
+    trailer = {}
+    assert list(iter_elements(chunked(DOCUMENT, size), trailer)) == EXPECTED
+    assert trailer == {"remark": "trailing \"elements\" text"}
+
+
+def test_trailer_empty_without_trailing_keys():
+    trailer = {}
+    assert list(iter_elements([b'{"version": 0.6, "elements": [{"id": 1}]}'], trailer)) == [{"id": 1}]
+    assert trailer == {}
+
+
+def test_truncated_trailer_raises():
+    with pytest.raises(OverpassStreamError):
+        list(iter_elements([b'{"elements": [], "remark": "runtime err'], {}))
+
+
+def test_array_not_following_key_raises():
+    with pytest.raises(OverpassStreamError):
+        list(iter_elements([b'{"elements": {"id": 1}}']))
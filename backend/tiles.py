@@ -0,0 +1,214 @@
+"""Tile-keyed emission-source POIs with versioning for conditional and delta responses.
+
+POIs are grouped into Web-Mercator tiles at a fixed zoom. Each tile's feature
+set gets a content hash that doubles as its HTTP ETag. The store remembers
+per-feature hashes for the last few versions of every tile, so a client that
+reports the version it holds can be sent only the features that were added,
+changed or removed since.
+
+Tile contents can also be kept in a SharedCache, so that every worker process
+serves the same version of a tile (and the same ETag) after a single fetch.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Zoom 14 tiles are roughly 2.4 km wide at the equator (~1.5 km at 50° latitude)
+TILE_ZOOM = 14
+
+
+def tile_for(lat, lon, zoom=TILE_ZOOM):
+    """Return the (x, y) of the tile containing the point."""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x, y, zoom=TILE_ZOOM):
+    """Return (south, west, north, east) of a tile in degrees."""
+    n = 2 ** zoom
+
+    def lat_of(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat_of(y + 1), x / n * 360.0 - 180.0, lat_of(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_key(x, y, zoom=TILE_ZOOM):
+    return f"{zoom}/{x}/{y}"
+
+
+def parse_tile_key(key):
+    """Parse "z/x/y" into ints. Raises ValueError for malformed keys."""
+    zoom, x, y = (int(part) for part in key.split("/"))
+    return zoom, x, y
+
+
+def tiles_covering(lat, lon, radius, zoom=TILE_ZOOM):
+    """Return the (x, y) tiles overlapping the square around a circle of ``radius`` metres."""
+    dlat = radius / 111320.0
+    dlon = radius / (111320.0 * max(math.cos(math.radians(lat)), 0.01))
+    x0, y0 = tile_for(lat + dlat, lon - dlon, zoom)
+    x1, y1 = tile_for(lat - dlat, lon + dlon, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def feature_hash(feature):
+    return hashlib.sha1(json.dumps(feature, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def compute_etag(feature_hashes):
+    """ETag for a tile from its {feature id: feature hash} mapping, independent of order."""
+    digest = hashlib.sha1()
+    for feature_id in sorted(feature_hashes):
+        digest.update(f"{feature_id}={feature_hashes[feature_id]};".encode())
+    return f'"{digest.hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Evaluate an If-None-Match header value against an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+class TileVersion:
+    def __init__(self, features, fetched_at):
+        self.features = features
+        self.fetched_at = fetched_at
+        self.hashes = {f["id"]: feature_hash(f) for f in features}
+        self.etag = compute_etag(self.hashes)
+
+
+class TileStore:
+    """In-process store of current tile contents plus recent version history.
+
+    ``fetch_features(south, west, north, east)`` must return the list of
+    GeoJSON Point features (each with a unique "id") inside the box.
+    When ``shared_cache`` is given, tiles missing here are looked up there
+    before fetching, and fetched tiles are written back to it.
+    """
+
+    def __init__(self, fetch_features, ttl=900, max_tiles=2048, history=4, shared_cache=None):
+        self.fetch_features = fetch_features
+        self.shared_cache = shared_cache
+        self.ttl = ttl
+        self.max_tiles = max_tiles
+        self.history = history
+        self._current = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, x, y):
+        """Return the current TileVersion, fetching it if missing or stale."""
+        return self.get_many([(x, y)])[(x, y)]
+
+    def get_many(self, tiles):
+        """Return {(x, y): TileVersion} for several tiles.
+
+        Missing or stale tiles are fetched together with one query over their
+        combined bounding box, then split per tile.
+        """
+        now = time.time()
+        result = {}
+        stale = []
+        with self._lock:
+            for x, y in tiles:
+                key = tile_key(x, y)
+                version = self._current.get(key)
+                if version is not None and now - version.fetched_at < self.ttl:
+                    self._current.move_to_end(key)
+                    result[(x, y)] = version
+                else:
+                    stale.append((x, y))
+        if not stale:
+            return result
+
+        # Another worker may already have fetched some of these tiles
+        loaded = {}
+        if self.shared_cache is not None:
+            for tile in stale:
+                cached = self.shared_cache.get("overpass_tile", tile_key(*tile))
+                if cached is not None and now - cached["fetched_at"] < self.ttl:
+                    loaded[tile] = (cached["features"], cached["fetched_at"])
+            stale = [tile for tile in stale if tile not in loaded]
+
+        if stale:
+            bounds = [tile_bounds(x, y) for x, y in stale]
+            features = self.fetch_features(
+                min(b[0] for b in bounds), min(b[1] for b in bounds),
+                max(b[2] for b in bounds), max(b[3] for b in bounds)
+            )
+            buckets = {tile: [] for tile in stale}
+            for feature in features:
+                lon, lat = feature["geometry"]["coordinates"]
+                tile = tile_for(lat, lon)
+                if tile in buckets:
+                    buckets[tile].append(feature)
+            fetched_at = time.time()
+            for tile, tile_features in buckets.items():
+                loaded[tile] = (tile_features, fetched_at)
+                if self.shared_cache is not None:
+                    self.shared_cache.set(
+                        "overpass_tile", tile_key(*tile),
+                        {"features": tile_features, "fetched_at": fetched_at}, self.ttl
+                    )
+
+        with self._lock:
+            for tile, (tile_features, fetched_at) in loaded.items():
+                version = TileVersion(tile_features, fetched_at)
+                key = tile_key(*tile)
+                self._current[key] = version
+                self._current.move_to_end(key)
+                history = self._versions.setdefault(key, OrderedDict())
+                history[version.etag] = version.hashes
+                history.move_to_end(version.etag)
+                while len(history) > self.history:
+                    history.popitem(last=False)
+                result[tile] = version
+            while len(self._current) > self.max_tiles:
+                evicted, _ = self._current.popitem(last=False)
+                self._versions.pop(evicted, None)
+        return result
+
+    def known_hashes(self, x, y, etag):
+        """{feature id: hash} of an earlier version of the tile, or None if it is no longer remembered."""
+        with self._lock:
+            return self._versions.get(tile_key(x, y), {}).get(etag)
+
+    def delta(self, tiles, have):
+        """Describe, per tile, how a client holding the ``have`` versions gets to the current ones.
+
+        ``have`` maps "z/x/y" keys to the ETag the client holds.
+        """
+        versions = self.get_many(tiles)
+        entries = []
+        for x, y in tiles:
+            version = versions[(x, y)]
+            key = tile_key(x, y)
+            held_etag = have.get(key)
+            entry = {"tile": key, "etag": version.etag}
+            if held_etag == version.etag:
+                entry["mode"] = "unchanged"
+                entries.append(entry)
+                continue
+            old_hashes = self.known_hashes(x, y, held_etag) if held_etag else None
+            if old_hashes is None:
+                entry["mode"] = "full"
+                entry["features"] = version.features
+            else:
+                # Changed features are sent under "added" too; clients replace them by id
+                entry["mode"] = "delta"
+                entry["added"] = [f for f in version.features if old_hashes.get(f["id"]) != version.hashes[f["id"]]]
+                entry["removed"] = sorted(set(old_hashes) - set(version.hashes))
+            entries.append(entry)
+        return entries